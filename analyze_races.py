@@ -0,0 +1,225 @@
+"""Offline statistics over a directory of recorded or exported races.
+
+Reads race logs (race_log.bin) and data exports (xlsx, csv, parquet and packed
+bin) and writes one table with a row per race and pooled rows at the end:
+
+    python analyze_races.py DATA_DIR --output summary.csv
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from entropy_stats import EntropyPercentile, entropy_by_count
+from race_engine import EMPIRICAL, THRESHOLD_MODES, THRESHOLD_PERCENTILE, expected_crossing_rate
+from race_export import BINARY_MAGIC, COLUMNS, read_packed
+from race_log import LOG_MAGIC, RaceLog, logged_threshold_mode
+
+EXPORT_EXTENSIONS = (".bin", ".csv", ".xlsx", ".parquet")
+RACES_PER_TASK = 200  # Races of one race log handled by each worker task
+
+
+def bit_strings_to_packed(strings, trial_size):
+    """Pack a column of '0'/'1' strings into rows of bytes."""
+    text = "".join(strings).encode("ascii")
+    bits = np.frombuffer(text, dtype=np.uint8).reshape(len(strings), trial_size) - ord("0")
+    return np.packbits(bits, axis=1)
+
+
+def streaming_thresholds(counts, trial_size):
+    """Return the 5th percentile threshold the game used at each trial of one car."""
+    threshold = EntropyPercentile(trial_size, THRESHOLD_PERCENTILE)
+    values = np.empty(len(counts))
+    for index, count in enumerate(counts):
+        threshold.add(int(count))
+        values[index] = threshold.percentile()
+    return values
+
+
+def crossing_z(crossings, trials, rate=THRESHOLD_PERCENTILE / 100):
+    """z-score of the number of trials below the threshold against the expected rate.
+
+    trials and rate may also be arrays, one value per pooled race.
+    """
+    trials = np.asarray(trials)
+    rate = np.asarray(rate)
+    variance = float((trials * rate * (1 - rate)).sum())
+    return (crossings - float((trials * rate).sum())) / np.sqrt(variance) if variance else np.nan
+
+
+def race_statistics(packed, trial_size, thresholds=None, player_choice=None, distance=None, threshold_mode=EMPIRICAL):
+    """Statistics of one race from the packed trials of both cars, shaped (2, trials, bytes).
+
+    Index 0 is the first trial, shown as "Green Car" in the exports. thresholds,
+    player_choice, distance and the threshold mode are only known for logged
+    races; thresholds are recomputed as empirical ones when missing.
+    """
+    counts = np.unpackbits(packed, axis=2, count=trial_size).sum(axis=2, dtype=np.int64)
+    table = np.array(entropy_by_count(trial_size))
+    entropies = table[counts]
+    if thresholds is None:
+        thresholds = np.stack([streaming_thresholds(car_counts, trial_size) for car_counts in counts])
+    trials = counts.shape[1]
+    bits = trials * trial_size
+    rate = expected_crossing_rate(threshold_mode, trial_size)
+    stats = {"trials": trials, "threshold_mode": threshold_mode, "expected_crossing_rate": rate}
+    for car in range(2):
+        ones = int(counts[car].sum())
+        crossings = int((entropies[car] < thresholds[car]).sum())
+        stats[f"ones_{car + 1}"] = ones
+        stats[f"bias_z_{car + 1}"] = (ones - bits / 2) / np.sqrt(bits / 4) if bits else np.nan
+        stats[f"entropy_mean_{car + 1}"] = float(entropies[car].mean()) if trials else np.nan
+        stats[f"entropy_p5_{car + 1}"] = float(np.percentile(entropies[car], 5)) if trials else np.nan
+        stats[f"crossings_{car + 1}"] = crossings
+        stats[f"crossing_rate_{car + 1}"] = crossings / trials if trials else np.nan
+        stats[f"crossing_z_{car + 1}"] = crossing_z(crossings, trials, rate)
+    stats["player_choice"] = player_choice
+    if distance is not None:
+        stats["moves_1"] = int((~np.isnan(distance[:, 0])).sum())
+        stats["moves_2"] = int((~np.isnan(distance[:, 1])).sum())
+    return stats
+
+
+def analyze_log(path, race_ids):
+    """Statistics of some races of a race log."""
+    log = RaceLog(path)
+    rows = []
+    for race_id, records in log.races(race_ids):
+        stats = race_statistics(
+            np.ascontiguousarray(records["bits"].swapaxes(0, 1)),
+            log.trial_size,
+            thresholds=records["threshold"].T,
+            player_choice=int(records["player_choice"][-1]),
+            distance=records["distance"],
+            threshold_mode=logged_threshold_mode(records),
+        )
+        rows.append({"file": os.path.basename(path), "race": f"{race_id:016x}", **stats})
+    return rows
+
+
+def read_export(path, trial_size):
+    """Return the packed trials of both cars from a data export."""
+    extension = os.path.splitext(path)[1]
+    if extension == ".bin":
+        with open(path, "rb") as file:
+            file_trial_size, packed = read_packed(file.read())
+        if file_trial_size != trial_size:
+            raise ValueError(f"{path} holds trials of {file_trial_size} bits")
+        return packed
+    if extension == ".parquet":
+        table = pd.read_parquet(path)
+        return np.stack([np.frombuffer(b"".join(table[column]), dtype=np.uint8).reshape(len(table), -1)
+                         for column in COLUMNS])
+    if extension == ".csv":
+        table = pd.read_csv(path, dtype=str)
+    else:
+        table = pd.read_excel(path, dtype=str)
+    return np.stack([bit_strings_to_packed(list(table[column]), trial_size) for column in COLUMNS])
+
+
+def analyze_export(path, trial_size):
+    """Statistics of the race held in a data export."""
+    stats = race_statistics(read_export(path, trial_size), trial_size)
+    return [{"file": os.path.basename(path), "race": os.path.splitext(os.path.basename(path))[0], **stats}]
+
+
+def file_kind(path):
+    """Return "log", "export" or None for a file of the data directory."""
+    if not path.endswith(EXPORT_EXTENSIONS):
+        return None
+    if path.endswith(".bin"):
+        with open(path, "rb") as file:
+            magic = file.read(4)
+        return {LOG_MAGIC: "log", BINARY_MAGIC: "export"}.get(magic)
+    return "export"
+
+
+def plan_tasks(directory, trial_size):
+    """Split the files of a directory into (function, args) tasks of similar size."""
+    tasks = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        kind = file_kind(path) if os.path.isfile(path) else None
+        if kind == "log":
+            race_ids = RaceLog(path).race_ids()
+            for start in range(0, len(race_ids), RACES_PER_TASK):
+                tasks.append((analyze_log, (path, race_ids[start:start + RACES_PER_TASK])))
+        elif kind == "export":
+            tasks.append((analyze_export, (path, trial_size)))
+    return tasks
+
+
+def _run_task(task):
+    function, args = task
+    return function(*args)
+
+
+def pooled_rows(races, trial_size):
+    """Pooled statistics over every race, then over the logged races of each chosen bit and each threshold mode."""
+    groups = [("pooled", {}, races)]
+    for choice in (0, 1):
+        groups.append((f"pooled choice={choice}", {"player_choice": choice}, races[races["player_choice"] == choice]))
+    for mode in THRESHOLD_MODES:
+        group = races[races["threshold_mode"] == mode]
+        groups.append((f"pooled threshold_mode={mode}", {"threshold_mode": mode}, group))
+    rows = []
+    for label, columns, group in groups:
+        if group.empty:
+            continue
+        trials = int(group["trials"].sum())
+        bits = trials * trial_size
+        row = {"file": "", "race": label, "races": len(group), "trials": trials, **columns}
+        for car in (1, 2):
+            ones = int(group[f"ones_{car}"].sum())
+            crossings = int(group[f"crossings_{car}"].sum())
+            row[f"ones_{car}"] = ones
+            row[f"bias_z_{car}"] = (ones - bits / 2) / np.sqrt(bits / 4)
+            row[f"entropy_mean_{car}"] = np.average(group[f"entropy_mean_{car}"], weights=group["trials"])
+            row[f"crossings_{car}"] = crossings
+            row[f"crossing_rate_{car}"] = crossings / trials
+            row[f"crossing_z_{car}"] = crossing_z(crossings, group["trials"], group["expected_crossing_rate"])
+            if f"moves_{car}" in group:
+                row[f"moves_{car}"] = group[f"moves_{car}"].sum()
+        rows.append(row)
+    return rows
+
+
+def analyze_directory(directory, trial_size=1000, workers=None):
+    """Return the summary table of every race found in a directory."""
+    tasks = plan_tasks(directory, trial_size)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rows = [row for result in executor.map(_run_task, tasks) for row in result]
+    races = pd.DataFrame(rows)
+    if races.empty:
+        return races
+    return pd.concat([races, pd.DataFrame(pooled_rows(races, trial_size))], ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize recorded and exported races.")
+    parser.add_argument("directory", help="Directory with race logs and data exports")
+    parser.add_argument("--output", default="race_summary.csv", help="Summary table (.csv or .xlsx)")
+    parser.add_argument("--trial-size", type=int, default=1000, help="Bits per trial in text exports")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = analyze_directory(args.directory, args.trial_size, args.workers)
+    if summary.empty:
+        print(f"No races found in {args.directory}")
+        return 1
+    if args.output.endswith(".xlsx"):
+        summary.to_excel(args.output, index=False)
+    else:
+        summary.to_csv(args.output, index=False)
+    races = int((~summary["race"].str.startswith("pooled")).sum())
+    print(f"{races} races summarized in {time.perf_counter() - start:.2f} s, written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
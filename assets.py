@@ -0,0 +1,86 @@
+import base64
+import hashlib
+import io
+import os
+import sys
+import threading
+
+CAR_SIZE = (150, 150)
+NUMBER_SIZE = (120, 120)  # Slightly larger than before, still smaller than the cars
+ASSETS = {
+    "car.png": CAR_SIZE,  # Red car
+    "car2.png": CAR_SIZE,  # Green car
+    "bandierina.png": CAR_SIZE,  # Flag of the same size as the cars
+    "0green.png": NUMBER_SIZE,
+    "1green.png": NUMBER_SIZE,
+    "0red.png": NUMBER_SIZE,
+    "1red.png": NUMBER_SIZE,
+}
+
+
+def image_to_base64(image):
+    """Convert an image to base64."""
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode()
+
+
+class AssetRegistry:
+    """Images of the race track, loaded, resized and encoded once per process."""
+
+    def __init__(self, image_dir, assets=ASSETS):
+        self.image_dir = image_dir
+        self.assets = assets
+        self._images = {}
+        self._encodings = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def image(self, name):
+        """Return the resized image of an asset."""
+        with self._lock:
+            if name not in self._images:
+                from PIL import Image  # Not needed until the track is drawn, after the consent page
+
+                with Image.open(os.path.join(self.image_dir, name)) as image:
+                    self._images[name] = image.resize(self.assets[name])
+            return self._images[name]
+
+    def base64(self, name):
+        """Return the PNG encoding of an asset, ready to embed in HTML."""
+        encoding = self._encodings.get(name)
+        if encoding is None:
+            encoding = image_to_base64(self.image(name))
+            self._encodings[name] = encoding
+        return encoding
+
+    @staticmethod
+    def digit_name(digit, colour):
+        """Return the file name of a digit image of the given colour ("green" or "red")."""
+        return f"{digit}{colour}.png"
+
+    def version(self):
+        """Return a short hash identifying the current encodings of every asset."""
+        if self._version is None:
+            digest = hashlib.sha1()
+            for name in sorted(self.assets):
+                digest.update(name.encode())
+                digest.update(self.base64(name).encode())
+            self._version = digest.hexdigest()[:12]
+        return self._version
+
+    def preload(self):
+        """Prepare every asset now instead of on first use."""
+        for name in self.assets:
+            self.base64(name)
+        return self
+
+    def encodings(self):
+        """Return the encodings of every asset by file name."""
+        return {name: self.base64(name) for name in self.assets}
+
+    def nbytes(self):
+        """Approximate memory held by decoded images and their encodings."""
+        image_bytes = sum(len(image.getbands()) * image.width * image.height for image in self._images.values())
+        encoding_bytes = sum(sys.getsizeof(encoding) for encoding in self._encodings.values())
+        return image_bytes + encoding_bytes
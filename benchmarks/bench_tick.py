@@ -0,0 +1,270 @@
+"""Benchmarks for the work done in one tick of the race loop.
+
+Runs offline from a fixed seed and compares every timing with a stored
+baseline. Usage:
+
+    python benchmarks/bench_tick.py                    # compare with baseline.json
+    python benchmarks/bench_tick.py --update-baseline  # store the current timings
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import mind_battle_car_game_streamlit as app  # noqa: E402
+from assets import AssetRegistry, image_to_base64  # noqa: E402
+from bit_sources import GeneratorBits, ReplayBits, UrandomBits  # noqa: E402
+from entropy_stats import BinomialPercentile, EntropyPercentile, TrialEvaluator, pack_bits  # noqa: E402
+from race_engine import TrialBatch, decide_moves, move_car, race_winner  # noqa: E402
+from track import track_cars  # noqa: E402
+
+SEED = 1234
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+RACE_LENGTHS = [10, 100, 1000, 10000, 100000]  # Trials already played when the tick runs
+DEFAULT_THRESHOLD = 2.0  # Allowed slowdown against the baseline, above timing noise
+STARTUP_RUNS = 5  # Fresh interpreters started to time the cold start
+DEFERRED_MODULES = ("rdoclient", "gspread", "oauth2client", "openpyxl", "pyarrow", "pandas", "PIL", "scipy")
+
+# Run in a fresh interpreter: time the import of the app and its first page, the
+# consent form, after Streamlit itself is loaded as it is in a running server
+STARTUP_SCRIPT = """
+import json, os, sys, time
+import numpy, streamlit
+from streamlit.testing.v1 import AppTest
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+import mind_battle_car_game_streamlit
+imported = time.perf_counter()
+at = AppTest.from_file(os.path.join(sys.argv[1], "mind_battle_car_game_streamlit.py"), default_timeout=60)
+start_page = time.perf_counter()
+at.run()
+shown = time.perf_counter()
+deferred = json.loads(sys.argv[2])
+print(json.dumps({
+    "import": imported - start,
+    "first_page": shown - start_page,
+    "eager": [name for name in deferred if name in sys.modules],
+}))
+"""
+
+
+def measure(func, repeat=7, min_time=0.05):
+    """Return the best time per call in seconds."""
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def history(trial_size, length, rng):
+    """Entropies and counts of ones of a race that already lasted the given number of trials."""
+    counts = rng.binomial(trial_size, 0.5, size=length)
+    evaluator = TrialEvaluator(trial_size)
+    return counts, [evaluator.entropy_table[count] for count in counts]
+
+
+def bench_tick_parts(rng):
+    """Time each stage of a tick at its usual size."""
+    np.random.seed(SEED)
+    trial_size = app.TRIAL_SIZE
+    evaluator = TrialEvaluator(trial_size)
+    bits = app.get_local_random_bits(trial_size)
+    bits_list = [int(bit) for bit in bits]  # Shape of a random.org response
+    packed = pack_bits(bits)
+    count_1, entropy, majority = evaluator.evaluate_packed(packed)
+    assets = AssetRegistry(REPO_DIR)
+    car_image = assets.image("car.png")
+    cars = track_cars(450.0, 320.0, (True, False), "0red.png", "1green.png")
+    tick_args = {"cars": cars, "asset_version": assets.version(), "assets": None, "interval": 0.5, "tick": 1}
+    first_args = dict(tick_args, assets=assets.encodings())
+
+    results = {
+        "get_local_random_bits": measure(lambda: app.get_local_random_bits(trial_size)),
+        "calculate_entropy": measure(lambda: app.calculate_entropy(bits_list)),
+        "evaluate_packed": measure(lambda: evaluator.evaluate_packed(packed)),
+        "evaluate_bits": measure(lambda: evaluator.evaluate(bits_list)),
+        "move_car_check_winner": measure(
+            lambda: race_winner(move_car(450.0, 57.3), move_car(320.0, 0))
+        ),
+        "decide_moves": measure(
+            lambda: decide_moves(1, 50, majority, entropy, 0.9985, entropy, 0.9985)
+        ),
+        "track_args_tick": measure(lambda: json.dumps(tick_args)),
+        "track_args_first_render": measure(lambda: json.dumps(first_args)),
+        "image_to_base64": measure(lambda: image_to_base64(car_image), repeat=3),
+    }
+    sizes = {
+        "track_args_tick_bytes": len(json.dumps(tick_args)),
+        "track_args_first_render_bytes": len(json.dumps(first_args)),
+    }
+    return results, sizes
+
+
+def bench_threshold_scaling(rng):
+    """Time the threshold update of one tick as the race gets longer."""
+    trial_size = app.TRIAL_SIZE
+    curves = {"np_percentile": {}, "entropy_percentile": {}, "binomial_percentile": {}}
+    analytic = BinomialPercentile(trial_size, 5)
+    for length in RACE_LENGTHS:
+        counts, entropies = history(trial_size, length, rng)
+        streaming = EntropyPercentile(trial_size, 5)
+        for count in counts:
+            streaming.add(int(count))
+        if streaming.percentile() != np.percentile(entropies, 5):
+            raise AssertionError(f"Streaming threshold differs from np.percentile after {length} trials")
+        next_counts = itertools.cycle(int(count) for count in rng.binomial(trial_size, 0.5, size=4096))
+
+        def legacy_tick():
+            entropies.append(entropies[-1])
+            np.percentile(entropies, 5)
+            entropies.pop()
+
+        def streaming_tick():
+            streaming.add(next(next_counts))
+            streaming.percentile()
+
+        def analytic_tick():
+            analytic.add(next(next_counts))
+            analytic.percentile()
+
+        curves["np_percentile"][str(length)] = measure(legacy_tick, repeat=5, min_time=0.02)
+        curves["entropy_percentile"][str(length)] = measure(streaming_tick, repeat=5, min_time=0.02)
+        curves["binomial_percentile"][str(length)] = measure(analytic_tick, repeat=5, min_time=0.02)
+    return curves
+
+
+def bench_bit_sources(rng):
+    """Time one trial from each local bit source."""
+    trial_size = app.TRIAL_SIZE
+    replay = ReplayBits.from_bytes(rng.bytes(64 * trial_size // 8), trial_size)
+    sources = {"urandom": UrandomBits(), "pcg64": GeneratorBits(SEED), "replay": replay}
+    results = {"bits_legacy_randint": measure(lambda: app.get_local_random_bits(trial_size))}
+    for name, source in sources.items():
+        results[f"bits_{name}"] = measure(lambda: source.take(0, trial_size))
+    return results
+
+
+def bench_trial_batch(rng):
+    """Time the evaluation of a trial of both cars, one by one as before and as part of a batch."""
+    trial_size = app.TRIAL_SIZE
+    evaluator = TrialEvaluator(trial_size)
+    rows = np.packbits(rng.integers(0, 2, size=(2, app.TRIAL_BATCH, trial_size), dtype=np.uint8), axis=2)
+    sources = ([None] * app.TRIAL_BATCH, [None] * app.TRIAL_BATCH)
+    thresholds = (EntropyPercentile(trial_size, 5), EntropyPercentile(trial_size, 5))
+    for threshold in thresholds:
+        for count in rng.binomial(trial_size, 0.5, size=1000):
+            threshold.add(int(count))
+
+    def per_trial():
+        for index in range(app.TRIAL_BATCH):
+            count_1, entropy_1, majority_1 = evaluator.evaluate_packed(rows[0, index])
+            count_2, entropy_2, _ = evaluator.evaluate_packed(rows[1, index])
+            thresholds[0].add(count_1)
+            thresholds[1].add(count_2)
+            decide_moves(1, 50, majority_1, entropy_1, thresholds[0].percentile(),
+                         entropy_2, thresholds[1].percentile())
+
+    def batched():
+        batch = TrialBatch(rows, sources, evaluator, thresholds)
+        for _ in range(app.TRIAL_BATCH):
+            batch.next_trial(1, 50)
+
+    return {
+        "trial_per_tick": measure(per_trial) / app.TRIAL_BATCH,
+        "trial_batched": measure(batched) / app.TRIAL_BATCH,
+    }
+
+
+def bench_startup():
+    """Time the cold start of the app and list the heavy modules loaded before the consent form is shown."""
+    runs = []
+    for _ in range(STARTUP_RUNS):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, REPO_DIR, json.dumps(DEFERRED_MODULES)],
+            capture_output=True, text=True, check=True, cwd=REPO_DIR,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    timings = {
+        "startup_import": min(run["import"] for run in runs),
+        "startup_first_page": min(run["first_page"] for run in runs),
+    }
+    return timings, sorted({name for run in runs for name in run["eager"]})
+
+
+def run():
+    rng = np.random.default_rng(SEED)
+    timings, sizes = bench_tick_parts(rng)
+    timings.update(bench_bit_sources(rng))
+    timings.update(bench_trial_batch(rng))
+    startup, eager_imports = bench_startup()
+    timings.update(startup)
+    curves = bench_threshold_scaling(rng)
+    for name, values in curves.items():
+        for length, seconds in values.items():
+            timings[f"{name}@{length}"] = seconds
+    return {"seconds": timings, "bytes": sizes, "eager_imports": eager_imports}
+
+
+def compare(results, baseline, threshold):
+    """Print results next to the baseline and return the names of regressed benchmarks."""
+    regressions = []
+    print(f"{'benchmark':40} {'current':>12} {'baseline':>12} {'ratio':>7}")
+    for name, seconds in results["seconds"].items():
+        reference = baseline.get("seconds", {}).get(name)
+        ratio = seconds / reference if reference else float("nan")
+        flag = ""
+        if reference and ratio > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        reference_text = f"{reference * 1e6:10.2f}us" if reference else f"{'-':>12}"
+        print(f"{name:40} {seconds * 1e6:10.2f}us {reference_text} {ratio:7.2f}{flag}")
+    for name, size in results["bytes"].items():
+        reference = baseline.get("bytes", {}).get(name)
+        flag = ""
+        if reference and size > reference * threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:40} {size:10d} B {reference if reference else '-':>10} B{flag}")
+    if results["eager_imports"]:
+        # Heavy dependencies must wait for the code paths that use them
+        regressions.append("startup_eager_imports")
+        print(f"{'startup_eager_imports':40} {', '.join(results['eager_imports'])}  REGRESSION")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tick hot path of the race loop.")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON file")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the current results as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown ratio")
+    args = parser.parse_args()
+
+    results = run()
+    if args.update_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than {args.threshold}x the baseline: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+"""Load test of concurrent race sessions through the real app script.
+
+Every simulated session is a Streamlit AppTest running the app on its own
+thread, like the sessions of one server. It accepts the consent, enters an API
+key, picks a bit and starts a race, which runs until a car wins. random.org
+and Google Sheets are replaced by stubs with a configurable latency; with
+--random-org-server, random.org is served over HTTP by the stand-in of
+random_org_stub.py instead, with its latency spread and error rate. The app
+is copied to a temporary directory first, so its spool, race log and metrics
+files stay out of the repository. Usage:
+
+    python benchmarks/load_test.py --sessions 1 2 4 8
+    python benchmarks/load_test.py --sessions 16 --interval 0.1 --output load.csv
+    python benchmarks/load_test.py --random-org-server --random-org-error-rate 0.2
+"""
+import argparse
+import base64
+import csv
+import importlib
+import itertools
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_NAME = "mind_battle_car_game_streamlit.py"
+API_KEY = "load-test-key"
+
+
+class StubRandomOrgClient:
+    """random.org client answering every request with local bytes after a fixed latency."""
+
+    latency = 0.3
+    requests = 0
+    _serials = itertools.count(1)
+    _lock = threading.Lock()
+
+    def __init__(self, api_key, *args, **kwargs):
+        self.api_key = api_key
+
+    def _blobs(self, n, size):
+        time.sleep(self.latency)
+        with self._lock:
+            StubRandomOrgClient.requests += 1
+        return [base64.b64encode(os.urandom(size // 8)).decode() for _ in range(n)]
+
+    def generate_blobs(self, n, size, *args, **kwargs):
+        return self._blobs(n, size)
+
+    def generate_signed_blobs(self, n, size, *args, **kwargs):
+        data = self._blobs(n, size)
+        with self._lock:
+            serial_number = next(self._serials)
+        return {"data": data, "random": {"serialNumber": serial_number}, "signature": ""}
+
+
+class StubSheetsConnection:
+    """Google Sheets worksheet that only counts the rows it receives after a fixed latency."""
+
+    latency = 0.5
+    rows = 0
+    _lock = threading.Lock()
+
+    def __init__(self, credentials_info, sheet_name, *args, **kwargs):
+        self.sheet_name = sheet_name
+
+    def append_row(self, row):
+        self.append_rows([row])
+
+    def append_rows(self, rows):
+        time.sleep(self.latency)
+        with self._lock:
+            StubSheetsConnection.rows += len(rows)
+
+
+class MessageBytes:
+    """Counts the bytes of the messages each session sends to its browser, by app session id."""
+
+    def __init__(self):
+        self.bytes = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, msg):
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx()
+        try:
+            session_id = ctx.session_state["session_id"] if ctx else None
+        except KeyError:
+            session_id = None  # Messages sent before the app assigned its session id
+        with self._lock:
+            self.bytes[session_id] = self.bytes.get(session_id, 0) + msg.ByteSize()
+
+
+def prepare_app(directory, interval):
+    """Copy the app to a directory, with the tick interval replaced, and return the script path."""
+    for name in os.listdir(REPO_DIR):
+        source = os.path.join(REPO_DIR, name)
+        if name.endswith((".py", ".png")):
+            shutil.copy(source, directory)
+        elif name == "track_component":
+            shutil.copytree(source, os.path.join(directory, name))
+    path = os.path.join(directory, APP_NAME)
+    with open(path, newline="") as file:
+        script = file.read()
+    script = re.sub(r"^REQUEST_INTERVAL = [^\s#]+", f"REQUEST_INTERVAL = {interval}", script, flags=re.MULTILINE)
+    with open(path, "w", newline="") as file:
+        file.write(script)
+    return path
+
+
+def install_stubs(app_dir, random_org_latency, sheets_latency):
+    """Make the app import the random.org and Sheets stubs."""
+    import rdoclient
+
+    sys.path.insert(0, app_dir)
+    import sheets
+
+    StubRandomOrgClient.latency = random_org_latency
+    StubSheetsConnection.latency = sheets_latency
+    rdoclient.RandomOrgClient = StubRandomOrgClient
+    sheets.SheetsConnection = StubSheetsConnection
+    importlib.import_module(os.path.splitext(APP_NAME)[0])  # Keep the imports out of the memory per session
+
+
+def share_script_cache():
+    """Compile the app once for all sessions, as a real server does, instead of once per AppTest run."""
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    script_cache = ScriptCache()
+    app_test.ScriptCache = lambda: script_cache
+    local_script_runner.ScriptCache = lambda: script_cache
+
+
+def rss_bytes():
+    """Resident memory of this process."""
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def run_session(script_path, index, multiplier, timeout, results):
+    """Drive one session through a whole race and store its tick times."""
+    from streamlit.testing.v1 import AppTest
+
+    result = {"session": index, "error": None}
+    try:
+        at = AppTest.from_file(script_path, default_timeout=60)
+        at.secrets["google_sheets"] = {"credentials_json": "{}"}
+        at.run()
+        at.checkbox[0].check().run()
+        at.text_input(key="api_key_input").input(API_KEY).run()
+        at.button(key="button1" if index % 2 == 0 else "button0").click().run()
+        at.run()  # The start button is enabled on the run after the choice
+        at.slider(key="move_multiplier").set_value(multiplier).run()
+        at.button(key="start_button").click().run(timeout=timeout)
+        state = at.session_state
+        result["session_id"] = state.session_id
+        result["tick_times"] = np.array([(due, started) for _, due, started in state.tick_times])
+        result["trial_bytes"] = state.trials_1.nbytes + state.trials_2.nbytes
+    except Exception as e:
+        result["error"] = repr(e)
+    results[index] = result
+
+
+def run_level(script_path, sessions, interval, multiplier, timeout, message_bytes):
+    """Run a number of concurrent sessions and return their capacity figures."""
+    results = {}
+    rss_before = rss_bytes()
+    cpu_before = time.process_time()
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=run_session, args=(script_path, index, multiplier, timeout, results))
+        for index in range(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_before
+    rss_growth = rss_bytes() - rss_before
+
+    finished = [result for result in results.values() if result["error"] is None and len(result["tick_times"])]
+    errors = [result["error"] for result in results.values() if result["error"] is not None]
+    ticks = sum(len(result["tick_times"]) for result in finished)
+    lateness = np.concatenate([result["tick_times"][:, 1] - result["tick_times"][:, 0] for result in finished] or [[]])
+    gaps = np.concatenate([np.diff(result["tick_times"][:, 1]) for result in finished] or [[]])
+    sent = sum(message_bytes.bytes.pop(result["session_id"], 0) for result in finished)
+
+    def milliseconds(values, q):
+        return float(np.percentile(values, q) * 1000) if len(values) else float("nan")
+
+    return {
+        "sessions": sessions,
+        "finished": len(finished),
+        "errors": len(errors),
+        "ticks": ticks,
+        "wall_s": wall,
+        "lateness_p50_ms": milliseconds(lateness, 50),
+        "lateness_p95_ms": milliseconds(lateness, 95),
+        "lateness_max_ms": milliseconds(lateness, 100),
+        "jitter_ms": float(np.std(gaps - interval) * 1000) if len(gaps) else float("nan"),
+        "cpu_cores": cpu / wall,
+        "cpu_ms_per_tick": cpu / ticks * 1000 if ticks else float("nan"),
+        "rss_mb_per_session": rss_growth / sessions / 2**20,
+        "trial_kb_per_session": sum(result["trial_bytes"] for result in finished) / max(len(finished), 1) / 1024,
+        "message_bytes_per_tick": sent / ticks if ticks else float("nan"),
+        "first_error": errors[0] if errors else "",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how many concurrent races one server can run.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8], help="Concurrent sessions per level")
+    parser.add_argument("--interval", type=float, default=0.5, help="Tick interval of the app (seconds)")
+    parser.add_argument("--multiplier", type=int, default=100, help="Move multiplier, higher ends races sooner")
+    parser.add_argument("--random-org-latency", type=float, default=0.3, help="Latency of each random.org request")
+    parser.add_argument("--random-org-server", action="store_true", help="Use the random.org stand-in server")
+    parser.add_argument("--random-org-sigma", type=float, default=0.5, help="Log-normal spread of its latency")
+    parser.add_argument("--random-org-error-rate", type=float, default=0.0, help="Share of its requests failing")
+    parser.add_argument("--sheets-latency", type=float, default=0.5, help="Latency of each Sheets write")
+    parser.add_argument("--timeout", type=float, default=900, help="Longest race allowed (seconds)")
+    parser.add_argument("--output", help="Also write the results to this CSV file")
+    args = parser.parse_args()
+
+    from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+
+    app_dir = tempfile.mkdtemp(prefix="car-race-load-")
+    try:
+        script_path = prepare_app(app_dir, args.interval)
+        install_stubs(app_dir, args.random_org_latency, args.sheets_latency)
+        stub = None
+        if args.random_org_server:
+            from random_org_stub import RandomOrgStub, start_server
+
+            stub = RandomOrgStub(args.random_org_latency, args.random_org_sigma, args.random_org_error_rate,
+                                 bits=10**9, requests=10**6)
+            _, url = start_server(stub)
+            os.environ["RANDOM_ORG_URL"] = url  # Read by the app script at every run
+        share_script_cache()
+        message_bytes = MessageBytes()
+        ForwardMsgQueue.on_before_enqueue_msg(message_bytes)
+
+        rows = []
+        for sessions in args.sessions:
+            row = run_level(script_path, sessions, args.interval, args.multiplier, args.timeout, message_bytes)
+            rows.append(row)
+            print(
+                f"{sessions:3d} sessions: {row['finished']} finished, {row['ticks']} ticks, "
+                f"lateness p50/p95/max {row['lateness_p50_ms']:.1f}/{row['lateness_p95_ms']:.1f}/"
+                f"{row['lateness_max_ms']:.1f} ms, jitter {row['jitter_ms']:.1f} ms, "
+                f"CPU {row['cpu_cores']:.2f} cores ({row['cpu_ms_per_tick']:.2f} ms/tick), "
+                f"RSS +{row['rss_mb_per_session']:.1f} MB/session, "
+                f"{row['message_bytes_per_tick']:.0f} B/tick to the browser"
+            )
+            if row["first_error"]:
+                print(f"    first error: {row['first_error']}")
+        random_org_requests = stub.stats()["requests"] if stub else StubRandomOrgClient.requests
+        print(f"random.org requests: {random_org_requests}, Sheets rows: {StubSheetsConnection.rows}")
+    finally:
+        ForwardMsgQueue.on_before_enqueue_msg(None)
+        shutil.rmtree(app_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
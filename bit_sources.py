@@ -0,0 +1,237 @@
+import base64
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+from race_export import BINARY_MAGIC, read_packed
+
+
+def blob_size(num_bits):
+    """Return the smallest blob size in bits accepted by random.org that holds num_bits bits."""
+    return -(-num_bits // 8) * 8
+
+
+def unpack_blobs(blobs, num_bits=None):
+    """Decode base64 random.org blobs into an array of bits, most significant bit of each byte first."""
+    packed = np.frombuffer(b"".join(base64.b64decode(blob) for blob in blobs), dtype=np.uint8)
+    return np.unpackbits(packed, count=num_bits)
+
+
+def unpack_bytes(data, num_bits):
+    """Expand random bytes into an array of num_bits bits."""
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=num_bits)
+
+
+def clear_padding(rows, num_bits):
+    """Zero the bits after num_bits in the last byte of each packed row, as np.packbits does."""
+    if num_bits % 8:
+        rows[..., -1] &= (0xFF << (8 - num_bits % 8)) & 0xFF
+    return rows
+
+
+class BitSource:
+    """Base class of the generators of trial bits.
+
+    take returns the bits of one trial of a car as a uint8 array, with their
+    provenance, or None when the bits have no external record. take_batch
+    returns several trials of a car at once, packed one per row. Every backend
+    counts the bits it produced and the time it took, to report throughput.
+    """
+
+    name = "source"
+    remote = False  # True when the bits come from random.org and a miss falls back to local bits
+
+    def __init__(self):
+        self.bits_produced = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def take(self, car, num_bits):
+        """Return the bits of the next trial of a car and their provenance."""
+        start = time.perf_counter()
+        bits, provenance = self._take(car, num_bits)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.bits_produced += len(bits)
+            self.seconds += elapsed
+        return bits, provenance
+
+    def take_batch(self, car, num_trials, num_bits):
+        """Return the next trials of a car packed as rows of bytes, with the provenance of each trial."""
+        start = time.perf_counter()
+        rows, provenance = self._take_batch(car, num_trials, num_bits)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.bits_produced += num_trials * num_bits
+            self.seconds += elapsed
+        return rows, provenance
+
+    def _take(self, car, num_bits):
+        raise NotImplementedError
+
+    def _take_batch(self, car, num_trials, num_bits):
+        # Trial by trial, so a batch holds the same bits as consecutive calls to take
+        rows = np.empty((num_trials, blob_size(num_bits) // 8), dtype=np.uint8)
+        provenance = []
+        for index in range(num_trials):
+            bits, source = self._take(car, num_bits)
+            rows[index] = np.packbits(bits)
+            provenance.append(source)
+        return rows, provenance
+
+    def label(self):
+        """Return the name of the source as saved with the race."""
+        return self.name
+
+    def throughput(self):
+        """Return the bits produced per second of generation time, or None before the first trial."""
+        with self._lock:
+            return self.bits_produced / self.seconds if self.seconds else None
+
+
+class RandomOrgBits(BitSource):
+    """Signed random.org blobs, one request per trial."""
+
+    name = "random.org"
+    remote = True
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    def fetch(self, num_bits):
+        """Request num_bits signed bits and return them with the serial number of the response."""
+        response = self.client.generate_signed_blobs(1, blob_size(num_bits))
+        return unpack_blobs(response["data"], num_bits), response["random"]["serialNumber"]
+
+    def _take(self, car, num_bits):
+        bits, serial_number = self.fetch(num_bits)
+        return bits, (serial_number, 0)
+
+    def _take_batch(self, car, num_trials, num_bits):
+        # One request returns a blob per trial
+        size = blob_size(num_bits)
+        response = self.client.generate_signed_blobs(num_trials, size)
+        rows = np.frombuffer(b"".join(base64.b64decode(blob) for blob in response["data"]), dtype=np.uint8)
+        serial_number = response["random"]["serialNumber"]
+        rows = clear_padding(rows.reshape(num_trials, size // 8).copy(), num_bits)
+        return rows, [(serial_number, index * size) for index in range(num_trials)]
+
+
+class PooledBits(BitSource):
+    """Trials taken from the EntropyPool shared by all sessions, or local bits when it is empty."""
+
+    name = "random.org"
+    remote = True
+
+    def __init__(self, pool, consumer, fallback):
+        super().__init__()
+        self.pool = pool
+        self.consumer = consumer
+        self.fallback = fallback  # Callable returning num_bits local bits
+
+    def _take(self, car, num_bits):
+        segment = self.pool.take(self.consumer) if self.pool else None
+        if segment is None:
+            return self.fallback(num_bits), None
+        return segment.bits, segment.source()
+
+
+class UrandomBits(BitSource):
+    """Operating system entropy from os.urandom."""
+
+    name = "os.urandom"
+
+    def _take(self, car, num_bits):
+        return unpack_bytes(os.urandom(blob_size(num_bits) // 8), num_bits), None
+
+    def _take_batch(self, car, num_trials, num_bits):
+        row_bytes = blob_size(num_bits) // 8
+        rows = np.frombuffer(os.urandom(num_trials * row_bytes), dtype=np.uint8).reshape(num_trials, row_bytes)
+        return clear_padding(rows.copy(), num_bits), [None] * num_trials
+
+
+class GeneratorBits(BitSource):
+    """Seeded PCG64 generators, one stream per car so a seed always replays the same race."""
+
+    name = "pcg64"
+
+    def __init__(self, seed=None, num_cars=2):
+        super().__init__()
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.generators = [
+            np.random.Generator(np.random.PCG64(child))
+            for child in np.random.SeedSequence(self.seed).spawn(num_cars)
+        ]
+
+    def _take(self, car, num_bits):
+        return unpack_bytes(self.generators[car].bytes(blob_size(num_bits) // 8), num_bits), None
+
+    def _take_batch(self, car, num_trials, num_bits):
+        # One draw per trial keeps the stream of a seed independent of the batch size
+        row_bytes = blob_size(num_bits) // 8
+        generator = self.generators[car]
+        data = b"".join(generator.bytes(row_bytes) for _ in range(num_trials))
+        rows = np.frombuffer(data, dtype=np.uint8).reshape(num_trials, row_bytes)
+        return clear_padding(rows.copy(), num_bits), [None] * num_trials
+
+    def label(self):
+        return f"{self.name}:{self.seed}"
+
+
+class ReplayBits(BitSource):
+    """Trials read back from a recording, starting over when it runs out."""
+
+    name = "replay"
+
+    def __init__(self, rows, origin):
+        super().__init__()
+        self.rows = rows  # Packed trials shaped (cars, trials, bytes)
+        self.origin = origin  # File digest or race id, saved with the race
+        if self.rows.shape[1] == 0:
+            raise ValueError("Replay file holds no trials")
+        self.positions = [0] * len(rows)
+
+    @classmethod
+    def from_bytes(cls, data, trial_size=1000, num_cars=2):
+        """Replay a packed binary race export, or raw random bytes read as consecutive trials of each car."""
+        if bytes(data[:len(BINARY_MAGIC)]) == BINARY_MAGIC:
+            file_trial_size, rows = read_packed(data)
+            if file_trial_size != trial_size:
+                raise ValueError(f"Replay file holds trials of {file_trial_size} bits, not {trial_size}")
+        else:
+            row_bytes = blob_size(trial_size) // 8
+            count = len(data) // (row_bytes * num_cars)
+            if count == 0:
+                raise ValueError("Replay file is too short for one trial of each car")
+            raw = np.frombuffer(data, dtype=np.uint8, count=count * num_cars * row_bytes)
+            rows = raw.reshape(count, num_cars, row_bytes).swapaxes(0, 1)
+        return cls(rows, hashlib.sha1(data).hexdigest()[:12])
+
+    @classmethod
+    def from_path(cls, path, trial_size=1000, num_cars=2):
+        """Replay a file from disk without reading it into memory."""
+        return cls.from_bytes(np.memmap(path, dtype=np.uint8, mode="r"), trial_size, num_cars)
+
+    @classmethod
+    def from_race_log(cls, race_log, race_id):
+        """Replay the trials of a race stored in a RaceLog."""
+        return cls(race_log.packed_trials(race_id), f"{race_id:016x}")
+
+    def _take(self, car, num_bits):
+        rows = self.rows[car]
+        index = self.positions[car] % len(rows)
+        self.positions[car] += 1
+        return np.unpackbits(rows[index], count=num_bits), None
+
+    def _take_batch(self, car, num_trials, num_bits):
+        rows = self.rows[car]
+        indices = (self.positions[car] + np.arange(num_trials)) % len(rows)
+        self.positions[car] += num_trials
+        return clear_padding(rows[indices, :blob_size(num_bits) // 8], num_bits), [None] * num_trials
+
+    def label(self):
+        return f"{self.name}:{self.origin}"
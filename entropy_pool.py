@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class Segment:
+    """A trial of bits cut from one random.org response."""
+
+    __slots__ = ("bits", "serial_number", "offset")
+
+    def __init__(self, bits, serial_number, offset):
+        self.bits = bits
+        self.serial_number = serial_number  # Serial number of the signed random.org response
+        self.offset = offset  # Position of the first bit in the response
+
+    def source(self):
+        """Return where the bits came from, as stored with the race."""
+        return (self.serial_number, self.offset)
+
+
+class EntropyPool:
+    """random.org bits shared by every session of the process.
+
+    A background thread fetches the missing trials in one request, up to
+    batch_size bits, and cuts each response into trials. Every trial is handed out once, to a single caller, with the
+    serial number of its response and its offset in it. The pool keeps depth
+    trials ready for each session that took a trial recently, so it grows with
+    the number of players instead of each session sending its own requests.
+    """
+
+    def __init__(self, fetch_response, trial_size=1000, depth=20, batch_size=1048000, retry_delay=1.0, active_window=5.0):
+        self.fetch_response = fetch_response  # Callable returning (bits, serial_number) for num_bits bits
+        self.trial_size = trial_size
+        self.depth = depth  # Trials kept ready for each active session
+        self.batch_size = max(batch_size - batch_size % trial_size, trial_size)  # Most bits per request
+        self.retry_delay = retry_delay
+        self.active_window = active_window  # Seconds after its last take during which a session counts as active
+        self.segments = deque()
+        self.last_take = {}
+        self.underruns = 0
+        self.fetched_trials = 0
+        self.served_trials = 0
+        self.requests = 0
+        self.failed_requests = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background producer."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="entropy-pool", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the background producer."""
+        self._stopped.set()
+        self._wakeup.set()
+
+    def take(self, consumer):
+        """Return the next unused Segment for a session, or None if the pool is empty."""
+        with self._lock:
+            self.last_take[consumer] = time.monotonic()
+            if self.segments:
+                segment = self.segments.popleft()
+                self.served_trials += 1
+            else:
+                segment = None
+                self.underruns += 1
+        self._wakeup.set()
+        return segment
+
+    def target_depth(self):
+        """Return the number of trials to keep ready for the sessions currently playing."""
+        with self._lock:
+            return self._target_depth()
+
+    def stats(self):
+        """Return pool depth, demand and request counters."""
+        with self._lock:
+            return {
+                "depth": len(self.segments),
+                "target_depth": self._target_depth(),
+                "sessions": len(self.last_take),
+                "underruns": self.underruns,
+                "fetched_trials": self.fetched_trials,
+                "served_trials": self.served_trials,
+                "requests": self.requests,
+                "failed_requests": self.failed_requests,
+            }
+
+    def _target_depth(self):
+        cutoff = time.monotonic() - self.active_window
+        for consumer in [consumer for consumer, last in self.last_take.items() if last < cutoff]:
+            del self.last_take[consumer]
+        return self.depth * max(len(self.last_take), 1)
+
+    def _add_response(self, bits, serial_number):
+        """Cut a response into trials and append them to the pool."""
+        bits = np.asarray(bits, dtype=np.uint8)
+        with self._lock:
+            for offset in range(0, len(bits) - self.trial_size + 1, self.trial_size):
+                self.segments.append(Segment(bits[offset:offset + self.trial_size], serial_number, offset))
+                self.fetched_trials += 1
+
+    def _run(self):
+        while not self._stopped.is_set():
+            with self._lock:
+                missing = self._target_depth() - len(self.segments)
+            if missing <= 0:
+                # Wake up on the next take, or when idle sessions may have dropped out
+                self._wakeup.wait(self.active_window)
+                self._wakeup.clear()
+                continue
+            try:
+                bits, serial_number = self.fetch_response(min(missing * self.trial_size, self.batch_size))
+            except Exception as e:
+                self.failed_requests += 1
+                # A paused client tells how long to wait before the next probe
+                self._stopped.wait(getattr(e, "retry_after", None) or self.retry_delay)
+                continue
+            self.requests += 1
+            self._add_response(bits, serial_number)
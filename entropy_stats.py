@@ -0,0 +1,243 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+_POPCOUNT_TABLE = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint16)
+
+
+def shannon_entropy(bits):
+    """Calculate entropy using Shannon's formula."""
+    n = len(bits)
+    counts = np.bincount(bits, minlength=2)
+    p = counts / n
+    p = p[np.nonzero(p)]
+    entropy = -np.sum(p * np.log2(p))
+    return entropy
+
+
+@lru_cache(maxsize=None)
+def entropy_by_count(trial_size):
+    """Return the entropy of a trial for every possible number of ones."""
+    trial = np.zeros(trial_size, dtype=np.int64)
+    values = []
+    for count_1 in range(trial_size + 1):
+        trial[trial_size - count_1:] = 1
+        values.append(shannon_entropy(trial))
+    return tuple(values)
+
+
+@lru_cache(maxsize=None)
+def binomial_entropy_percentile(trial_size=1000, q=5):
+    """Return the q-th percentile of the entropy of a trial of fair bits, from the exact binomial distribution.
+
+    Entropy falls as the number of ones moves away from half the trial on
+    either side, so the trials at or below the entropy of k ones, for k below
+    the middle, have probability 2 * P(K <= k). The percentile is the entropy
+    of the smallest k for which that reaches q.
+    """
+    from scipy.stats import binom  # Only the analytic threshold needs scipy
+
+    count_1 = int(binom.ppf(q / 100 / 2, trial_size, 0.5))  # Half of the tail lies on each side of the middle
+    return entropy_by_count(trial_size)[count_1]
+
+
+@lru_cache(maxsize=None)
+def binomial_crossing_rate(trial_size=1000, q=5):
+    """Return the probability that a trial of fair bits has an entropy strictly below binomial_entropy_percentile.
+
+    The entropy only takes a few values, so this falls short of q percent, by
+    more as trials get smaller.
+    """
+    from scipy.stats import binom
+
+    below = np.array(entropy_by_count(trial_size)) < binomial_entropy_percentile(trial_size, q)
+    return float(binom.pmf(np.arange(trial_size + 1), trial_size, 0.5)[below].sum())
+
+
+def pack_bits(bits):
+    """Pack a sequence of 0/1 bits into bytes."""
+    return np.packbits(np.asarray(bits, dtype=np.uint8))
+
+
+def popcount(packed):
+    """Count the ones in an array of packed bytes."""
+    packed = np.asarray(packed, dtype=np.uint8)
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(packed).sum())
+    return int(_POPCOUNT_TABLE[packed].sum())
+
+
+def popcount_rows(packed):
+    """Count the ones in each row of packed bytes, summing over the last axis."""
+    packed = np.asarray(packed, dtype=np.uint8)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(packed).sum(axis=-1, dtype=np.int64)
+    return _POPCOUNT_TABLE[packed].sum(axis=-1, dtype=np.int64)
+
+
+def majority_bit(count_1, trial_size):
+    """Return the more frequent bit of a trial, or None on a tie."""
+    count_0 = trial_size - count_1
+    if count_1 > count_0:
+        return 1
+    if count_0 > count_1:
+        return 0
+    return None
+
+
+def majority_bits(counts, trial_size):
+    """Return the more frequent bit of many trials, or -1 on a tie."""
+    counts = np.asarray(counts)
+    count_0 = trial_size - counts
+    return np.where(counts > count_0, 1, np.where(count_0 > counts, 0, -1))
+
+
+class TrialEvaluator:
+    """Evaluate trials of a fixed size from their number of ones.
+
+    Entropy only depends on how many ones a trial holds, so it is read from a
+    table built once per trial size instead of being recomputed every tick.
+    """
+
+    def __init__(self, trial_size=1000):
+        self.trial_size = trial_size
+        self.entropy_table = entropy_by_count(trial_size)
+        self.entropy_array = np.array(self.entropy_table)  # Same table, indexed by arrays of counts
+
+    def evaluate_count(self, count_1):
+        """Return the count of ones, the entropy and the majority bit."""
+        return count_1, self.entropy_table[count_1], majority_bit(count_1, self.trial_size)
+
+    def evaluate_packed(self, packed):
+        """Evaluate a trial stored as packed bytes."""
+        return self.evaluate_count(popcount(packed))
+
+    def evaluate(self, bits):
+        """Evaluate a trial given as a sequence of 0/1 bits."""
+        return self.evaluate_packed(pack_bits(bits))
+
+
+def calculate_entropy(bits):
+    """Calculate entropy using Shannon's formula."""
+    return entropy_by_count(len(bits))[popcount(pack_bits(bits))]
+
+
+def interpolate_percentile(lower, upper, gamma):
+    """Linear interpolation between two order statistics, as done by np.percentile."""
+    diff = upper - lower
+    if gamma >= 0.5:
+        return upper - diff * (1 - gamma)
+    return lower + diff * gamma
+
+
+class EntropyPercentile:
+    """Streaming percentile of trial entropies.
+
+    A trial of n bits can only have n + 1 entropies, one per number of ones,
+    so the history is kept as a histogram ordered by entropy. A cursor on the
+    order statistic below the percentile moves by a few bins per trial, which
+    makes both updates and queries independent of the race length. Results
+    match np.percentile with the default linear interpolation.
+    """
+
+    def __init__(self, trial_size=1000, q=5):
+        self.trial_size = trial_size
+        self.q = q / 100
+        values = entropy_by_count(trial_size)
+        order = sorted(range(trial_size + 1), key=values.__getitem__)
+        self.values = [values[count_1] for count_1 in order]  # Entropies in ascending order
+        self.position = [0] * (trial_size + 1)  # Count of ones -> histogram bin
+        for bin_index, count_1 in enumerate(order):
+            self.position[count_1] = bin_index
+        self.counts = [0] * (trial_size + 1)
+        self.n = 0
+        self._bin = 0  # Bin holding the order statistic at the cursor
+        self._below = 0  # Number of trials in bins before the cursor
+
+    def add(self, count_1):
+        """Record a trial by its number of ones and return its entropy."""
+        bin_index = self.position[count_1]
+        self.counts[bin_index] += 1
+        self.n += 1
+        if bin_index < self._bin:
+            self._below += 1
+        return self.values[bin_index]
+
+    def add_many(self, counts):
+        """Record trials in order and return the percentile after each of them.
+
+        Every threshold depends on all the trials before it, so the histogram
+        is still updated one trial at a time, at a constant cost per trial.
+        """
+        percentiles = np.empty(len(counts))
+        for index, count_1 in enumerate(counts):
+            self.add(int(count_1))
+            percentiles[index] = self.percentile()
+        return percentiles
+
+    def _seek(self, rank):
+        """Move the cursor to the bin holding the order statistic of the given rank."""
+        counts = self.counts
+        bin_index, below = self._bin, self._below
+        while rank < below:
+            bin_index -= 1
+            below -= counts[bin_index]
+        while rank >= below + counts[bin_index]:
+            below += counts[bin_index]
+            bin_index += 1
+        self._bin, self._below = bin_index, below
+        return bin_index
+
+    def _next_value(self, bin_index, rank):
+        """Return the order statistic after the one at the given rank."""
+        if rank + 1 < self._below + self.counts[bin_index]:
+            return self.values[bin_index]
+        bin_index += 1
+        while self.counts[bin_index] == 0:
+            bin_index += 1
+        return self.values[bin_index]
+
+    def percentile(self):
+        """Return the percentile of all recorded entropies."""
+        if self.n == 0:
+            raise ValueError("No trials recorded")
+        virtual_index = (self.n - 1) * self.q
+        if virtual_index >= self.n - 1:
+            rank = self.n - 1
+            return self.values[self._seek(rank)]
+        rank = int(virtual_index)
+        gamma = virtual_index - rank
+        bin_index = self._seek(rank)
+        lower = self.values[bin_index]
+        upper = self._next_value(bin_index, rank)
+        return interpolate_percentile(lower, upper, gamma)
+
+
+class BinomialPercentile:
+    """Percentile of trial entropies under fair bits, with the interface of EntropyPercentile.
+
+    The cutoff comes from the binomial distribution instead of the race
+    history, so it is computed once and stays the same from the first trial.
+    """
+
+    def __init__(self, trial_size=1000, q=5):
+        self.trial_size = trial_size
+        self.q = q / 100
+        self.value = binomial_entropy_percentile(trial_size, q)
+        self.entropy_table = entropy_by_count(trial_size)
+        self.n = 0
+
+    def add(self, count_1):
+        """Record a trial by its number of ones and return its entropy."""
+        self.n += 1
+        return self.entropy_table[count_1]
+
+    def add_many(self, counts):
+        """Record trials and return the percentile after each of them."""
+        self.n += len(counts)
+        return np.full(len(counts), self.value)
+
+    def percentile(self):
+        """Return the percentile, the same at every trial."""
+        return self.value
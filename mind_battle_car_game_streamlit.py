@@ -1,24 +1,73 @@
 import streamlit as st
 import time
 import numpy as np
-import pandas as pd
-from PIL import Image
-import base64
-import io
 import os
-from rdoclient import RandomOrgClient
 import json
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-
-MAX_BATCH_SIZE = 1000  # Maximum batch size for requests to random.org
+import uuid
+import atexit
+from entropy_pool import EntropyPool
+from random_org import CLOSED, CircuitBreaker, JsonRpcClient, RandomOrgService
+from bit_sources import GeneratorBits, PooledBits, RandomOrgBits, ReplayBits, UrandomBits
+from entropy_stats import TrialEvaluator, calculate_entropy
+from trial_store import TrialStore
+from sheets import SheetsConnection
+from race_spool import RaceSpool
+from assets import AssetRegistry, image_to_base64
+from track import race_track, track_cars
+from race_engine import EMPIRICAL, GREEN, RED, THRESHOLD_MODES, TrialBatch, move_car, race_winner, threshold_tracker
+from tick_metrics import TickMetrics
+from tick_scheduler import ConcurrentFetcher, TickScheduler
+from race_export import EXPORT_FORMATS, export_trials
+from race_log import RaceLogWriter
+from trial_archive import HAS_PYARROW, TrialArchive
+
+MAX_BATCH_SIZE = 1048576  # Most bits in one signed blob request to random.org, the pool asks only for the missing trials
 RETRY_LIMIT = 3  # Number of retry attempts for random.org requests
+HTTP_TIMEOUT = 10.0  # Longest wait for a random.org response (in seconds)
+MAX_ADVISORY_WAIT = 60.0  # Longest advisory delay waited before a request, a longer one counts as a failure
+BREAKER_FAILURES = 3  # Consecutive failed requests that pause random.org
+BREAKER_PAUSE = 5.0  # First pause before probing random.org again, doubled after each failed probe (in seconds)
+RANDOM_ORG_URL = os.environ.get("RANDOM_ORG_URL")  # Other JSON-RPC endpoint, such as the stand-in of random_org_stub.py
 REQUEST_INTERVAL = 0.5  # Interval between requests (in seconds)
+TRIAL_SIZE = 1000  # Number of bits per trial
+TRIAL_BATCH = 10  # Trials of each car fetched and evaluated together, played one per tick
+PREFETCH_DEPTH = 2 * TRIAL_BATCH  # Number of trials kept ready for each active session (one batch per car)
+IMAGE_DIR = os.path.abspath(os.path.dirname(__file__))
+SPOOL_PATH = os.path.join(IMAGE_DIR, "race_spool.sqlite3")  # Race rows waiting for Sheets
+RACE_ID_COLUMN = 16  # Position of the race id in a race row, to find rows already written after a failed append
+PRELOAD_ASSETS = True  # Prepare every image when the first session starts
+METRICS_PATH = os.path.join(IMAGE_DIR, "tick_metrics.prom")  # Read by a local Prometheus textfile collector
+METRICS_EXPORT_INTERVAL = 10  # Minimum time between two writes of the metrics file (in seconds)
+DIAGNOSTICS_REFRESH_TICKS = 10  # Ticks between two refreshes of the diagnostics panel
+TICK_POLICY = "skip"  # "skip" drops the ticks missed during a stall, "catch_up" runs them back to back
+FETCH_WORKERS = 8  # Threads fetching the trials of both cars, shared by all sessions
+RACE_LOG_PATH = os.path.join(IMAGE_DIR, "race_log.bin")  # Append-only log of every tick, see race_log.py
+ARCHIVE_DIR = os.path.join(IMAGE_DIR, "trial_archive")  # Parquet files of every trial, see trial_archive.py
+ARCHIVE_FLUSH_INTERVAL = 30.0  # Longest time a trial waits in memory before it is archived (in seconds)
+BIT_SOURCES = ("random.org", "os.urandom", "pcg64", "replay")  # Bit sources a session can choose
+
+@st.cache_resource
+def get_random_org_client(api_key):
+    """Return the RANDOM.ORG client of an API key, shared by all sessions and reruns.
+
+    The client retries, tracks the allowance of the key and stops sending
+    requests for a while after repeated failures.
+    """
+    if RANDOM_ORG_URL:
+        client = JsonRpcClient(api_key, RANDOM_ORG_URL, http_timeout=HTTP_TIMEOUT)
+    else:
+        from rdoclient import RandomOrgClient  # Imported once a key is entered, after the page is shown
+
+        # Requests are sent one at a time by the pool thread; rdoclient's own queue thread dies on a network error
+        client = RandomOrgClient(
+            api_key, blocking_timeout=MAX_ADVISORY_WAIT, http_timeout=HTTP_TIMEOUT, serialized=False
+        )
+    return RandomOrgService(client, retry_limit=RETRY_LIMIT, breaker=CircuitBreaker(BREAKER_FAILURES, BREAKER_PAUSE))
 
 def configure_random_org(api_key):
     """Configure the RANDOM.ORG client if the API key is valid."""
     try:
-        client = RandomOrgClient(api_key)
+        client = get_random_org_client(api_key)
         return client
     except Exception as e:
         st.error(f"Error configuring the random.org client: {e}")
@@ -28,8 +77,8 @@ def get_random_bits_from_random_org(num_bits, client=None):
     """Get random bits from random.org or use a local pseudorandom generator."""
     try:
         if client:
-            # Use RANDOM.ORG
-            random_bits = client.generate_integers(num_bits, 0, 1)
+            # Use RANDOM.ORG, reading the bits from a binary blob
+            random_bits, _ = RandomOrgBits(client).take(0, num_bits)
             return random_bits, True
         else:
             # Use a local pseudorandom generator
@@ -40,52 +89,126 @@ def get_random_bits_from_random_org(num_bits, client=None):
         random_bits = get_local_random_bits(num_bits)
         return random_bits, False
 
+@st.cache_resource
+def configure_entropy_pool(api_key, _client):
+    """Start the pool of random.org bits shared by all sessions using this API key."""
+    random_org_bits = RandomOrgBits(_client)
+
+    def fetch_response(num_bits):
+        # Smaller requests when the allowance of the key runs low
+        return random_org_bits.fetch(_client.batch_bits(num_bits, TRIAL_SIZE))
+
+    pool = EntropyPool(
+        fetch_response,
+        trial_size=TRIAL_SIZE,
+        depth=PREFETCH_DEPTH,
+        batch_size=MAX_BATCH_SIZE,
+    )
+    return pool.start()
+
+def configure_bit_source(choice, entropy_pool, session_id, replay_data=None):
+    """Create the bit source chosen for a session.
+
+    random.org bits come from the shared pool, with local bits when it is empty
+    or no API key is set. A replay without a valid file uses random.org too.
+    """
+    if choice == "os.urandom":
+        return UrandomBits()
+    if choice == "pcg64":
+        return GeneratorBits()
+    if choice == "replay" and replay_data is not None:
+        return ReplayBits.from_bytes(replay_data, TRIAL_SIZE)
+    return PooledBits(entropy_pool, session_id, get_local_random_bits)
+
+def random_org_serials(trial_sources):
+    """Return the serial numbers of the random.org responses used by a race, in order of first use."""
+    serials = {}
+    for sources in trial_sources:
+        for source in sources:
+            if source is not None:
+                serials.setdefault(source[0], None)
+    return list(serials)
+
+def random_org_segments(trial_sources):
+    """Return the [serial number, offset] of every random.org trial, in order."""
+    return [list(source) for sources in trial_sources for source in sources if source is not None]
+
 def get_local_random_bits(num_bits):
     """Generate pseudorandom bits locally."""
-    return list(np.random.randint(0, 2, size=num_bits))
-
-def calculate_entropy(bits):
-    """Calculate entropy using Shannon's formula."""
-    n = len(bits)
-    counts = np.bincount(bits, minlength=2)
-    p = counts / n
-    p = p[np.nonzero(p)]
-    entropy = -np.sum(p * np.log2(p))
-    return entropy
-
-def move_car(car_pos, distance):
-    """Move the car a certain distance."""
-    car_pos += distance
-    if car_pos > 900:  # Shorten the track to leave room for the flag
-        car_pos = 900
-    return car_pos
-
-def image_to_base64(image):
-    """Convert an image to base64."""
-    buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode()
+    return np.random.randint(0, 2, size=num_bits, dtype=np.uint8)
+
+@st.cache_resource
+def load_assets():
+    """Load the car, flag and number images once for all sessions."""
+    assets = AssetRegistry(IMAGE_DIR)
+    if PRELOAD_ASSETS:
+        assets.preload()
+    return assets
 
+@st.cache_resource
 def configure_google_sheets(sheet_name):
-    """Configure Google Sheets using credentials from Streamlit Secrets."""
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+    """Configure Google Sheets using credentials from Streamlit Secrets.
+
+    The connection is shared by all sessions and only opened when a row is saved.
+    """
     credentials_info = json.loads(st.secrets["google_sheets"]["credentials_json"])
-    credentials = ServiceAccountCredentials.from_json_keyfile_dict(credentials_info, scope)
-    client = gspread.authorize(credentials)
-    sheet = client.open(sheet_name)
-    sheet1 = sheet.sheet1  # First sheet
-    return sheet1
-
-def save_race_data(sheet, race_data):
-    """Save race data to Google Sheets."""
+    return SheetsConnection(credentials_info, sheet_name)
+
+@st.cache_resource
+def configure_race_spool(sheet_name):
+    """Start the process-wide queue that writes race rows to Google Sheets in the background."""
+    return RaceSpool(SPOOL_PATH, configure_google_sheets(sheet_name), key_column=RACE_ID_COLUMN).start()
+
+@st.cache_resource
+def get_tick_metrics():
+    """Return the timing histograms shared by all sessions."""
+    return TickMetrics()
+
+@st.cache_resource
+def get_race_log():
+    """Open the race log shared by all sessions."""
+    return RaceLogWriter(RACE_LOG_PATH, TRIAL_SIZE)
+
+@st.cache_resource
+def get_trial_archive():
+    """Start the archive of every trial shared by all sessions, or return None without pyarrow."""
+    if not HAS_PYARROW:
+        return None
+    archive = TrialArchive(ARCHIVE_DIR, TRIAL_SIZE, flush_interval=ARCHIVE_FLUSH_INTERVAL).start()
+    atexit.register(archive.close)  # Write the buffered trials when the server stops
+    return archive
+
+@st.cache_resource
+def get_trial_fetcher():
+    """Return the thread pool that fetches the trials of both cars concurrently."""
+    return ConcurrentFetcher(FETCH_WORKERS)
+
+def has_sheets_credentials():
+    """Return True if the Streamlit secrets hold Google Sheets credentials."""
+    try:
+        return "google_sheets" in st.secrets
+    except FileNotFoundError:
+        return False  # No secrets file at all
+
+def save_race_data(race_data):
+    """Queue race data for Google Sheets, reporting missing or malformed credentials."""
     try:
-        sheet.append_row(race_data)
+        if not has_sheets_credentials():
+            raise RuntimeError("no google_sheets credentials in the Streamlit secrets")
+        configure_race_spool("test").put(race_data)
     except Exception as e:
         st.error(f"Error saving data to Google Sheets: {e}")
 
 def main():
     st.set_page_config(page_title="Car Mind Race", layout="wide")
 
+    # Start the spool with the process, so rows left by a crash or restart are sent without waiting for a race
+    if has_sheets_credentials():
+        try:
+            configure_race_spool("test")
+        except Exception:
+            pass  # Malformed credentials are reported by save_race_data when a race ends
+
     if "language" not in st.session_state:
         st.session_state.language = "Italiano"
 
@@ -98,6 +221,9 @@ def main():
     if "consent_given" not in st.session_state:
         st.session_state.consent_given = False
 
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+
     # Function to change language
     def toggle_language():
         if st.session_state.language == "Italiano":
@@ -131,6 +257,7 @@ def main():
         stop_race_text = "Blocca Gara"
         reset_game_text = "Resetta Gioco"
         download_data_text = "Scarica Dati"
+        export_format_text = "Formato"
         api_key_text = "Inserisci API Key per random.org"
         retry_text = "Voglio riprovare"
         reset_game_message = "Gioco resettato!"
@@ -138,6 +265,18 @@ def main():
         win_message = "Vince l'auto {}, complimenti!"
         api_description_text = "Per garantire il corretto utilizzo, è consigliabile acquistare un piano per l'inserimento della chiave API da questo sito: [https://api.random.org/pricing](https://api.random.org/pricing)."
         move_multiplier_text = "Moltiplicatore di Movimento"
+        buffer_status_text = "Riserva random.org: {} / {} prove pronte per {} sessioni, {} esaurimenti"
+        random_org_paused_text = "random.org in pausa, nuovo tentativo tra {:.0f} s: {}"
+        random_org_quota_text = "Quota random.org: {} bit e {} richieste rimasti"
+        diagnostics_text = "Diagnostica"
+        bit_source_text = "Fonte dei bit"
+        threshold_mode_text = "Soglia di movimento"
+        threshold_mode_labels = {"empirical": "5° percentile della gara", "analytic": "5° percentile teorico (binomiale)"}
+        replay_file_text = "File da riprodurre (esportazione binaria o byte casuali)"
+        replay_missing_text = "Carica un file da riprodurre, fino ad allora si usa random.org."
+        bit_source_throughput_text = "Fonte {}: {:.1f} Mbit/s"
+        asset_memory_text = "Immagini in memoria: {:.0f} KiB"
+        diagnostics_counters_text = "Tick: {ticks}, bit locali di riserva: {local_fallbacks}, intervalli superati: {interval_overruns}, tick saltati: {skipped_ticks}"
         email_ref_text = "Riferimento Email: riccardoboscariol97@gmail.com"
     else:
         title_text = "Car Mind Race"
@@ -162,6 +301,7 @@ def main():
         stop_race_text = "Stop Race"
         reset_game_text = "Reset Game"
         download_data_text = "Download Data"
+        export_format_text = "Format"
         api_key_text = "Enter API Key for random.org"
         retry_text = "I want to retry"
         reset_game_message = "Game reset!"
@@ -169,6 +309,18 @@ def main():
         win_message = "The {} car wins, congratulations!"
         api_description_text = "To ensure proper use, it is advisable to purchase a plan for entering the API key from this site: [https://api.random.org/pricing](https://api.random.org/pricing)."
         move_multiplier_text = "Movement Multiplier"
+        buffer_status_text = "random.org pool: {} / {} trials ready for {} sessions, {} underruns"
+        random_org_paused_text = "random.org paused, next attempt in {:.0f} s: {}"
+        random_org_quota_text = "random.org quota: {} bits and {} requests left"
+        diagnostics_text = "Diagnostics"
+        bit_source_text = "Bit source"
+        threshold_mode_text = "Move threshold"
+        threshold_mode_labels = {"empirical": "5th percentile of the race", "analytic": "Theoretical 5th percentile (binomial)"}
+        replay_file_text = "File to replay (binary export or random bytes)"
+        replay_missing_text = "Upload a file to replay, random.org is used until then."
+        bit_source_throughput_text = "Source {}: {:.1f} Mbit/s"
+        asset_memory_text = "Images in memory: {:.0f} KiB"
+        diagnostics_counters_text = "Ticks: {ticks}, local fallbacks: {local_fallbacks}, interval overruns: {interval_overruns}, skipped ticks: {skipped_ticks}"
         email_ref_text = "Email Referee: riccardoboscariol97@gmail.com"
 
     # Mantieni il titolo con dimensioni maggiori
@@ -204,78 +356,6 @@ def main():
             position: relative;
             top: 0px; /* Correct slider thumb position */
         }}
-        .slider-container {{
-            position: relative;
-            height: 250px; /* Height to fit sliders and cars */
-            margin-bottom: 50px;
-        }}
-        .slider-container.first {{
-            margin-top: 50px;
-            margin-bottom: 40px;
-        }}
-        .car-image {{
-            position: absolute;
-            top: 50px;  /* Move car 3px higher */
-            left: 0px;
-            width: 150px;  /* Width of the car image */
-            z-index: 20;  /* Ensure cars are above numbers */
-        }}
-        .number-image {{
-            position: absolute;
-            top: calc(28px - 1px);  /* Adjust position: 1px lower */
-            left: calc(80px - 7px); /* Adjust position: 7px to the left */
-            transform: translateX(-50%); /* Center horizontally */
-            width: calc(110px + 10px);  /* Width of the number images slightly larger */
-            z-index: 10;  /* Ensure numbers are below cars */
-            display: none; /* Initially hide numbers */
-        }}
-        .flag-image {{
-            position: absolute;
-            top: 25px;  /* Position for flag */
-            width: 150px;
-            left: 93%;  /* Move flag 3px left */
-        }}
-        .slider-container input[type=range] {{
-            -webkit-appearance: none;
-            width: 100%;
-            position: absolute;
-            top: 138px;  /* Slider 22px higher */
-            background: #f0f0f0; /* Slider track color */
-        }}
-        .slider-container input[type=range]:focus {{
-            outline: none;
-        }}
-        .slider-container input[type=range]::-webkit-slider-runnable-track {{
-            width: 100%;
-            height: 8px;
-            background: #f0f0f0; /* Track color */
-            border-radius: 5px;
-            cursor: pointer;
-        }}
-        .slider-container input[type=range]::-webkit-slider-thumb {{
-            -webkit-appearance: none;
-            appearance: none;
-            width: 10px; /* Thumb width */
-            height: 20px; /* Thumb height */
-            background: transparent; /* Make thumb invisible */
-            cursor: pointer;
-            margin-top: -6px; /* Adjust thumb position to align with the track */
-            visibility: hidden; /* Hide the thumb */
-        }}
-        .slider-container input[type=range]::-moz-range-thumb {{
-            width: 10px; /* Thumb width */
-            height: 20px; /* Thumb height */
-            background: transparent; /* Make thumb invisible */
-            cursor: pointer;
-            visibility: hidden; /* Hide the thumb */
-        }}
-        .slider-container input[type=range]::-ms-thumb {{
-            width: 10px; /* Thumb width */
-            height: 20px; /* Thumb height */
-            background: transparent; /* Make thumb invisible */
-            cursor: pointer;
-            visibility: hidden; /* Hide the thumb */
-        }}
         .stButton > button {{
             display: inline-block;
             margin: 5px; /* Margin between buttons */
@@ -311,18 +391,27 @@ def main():
         st.session_state.car1_moves = 0
     if "car2_moves" not in st.session_state:
         st.session_state.car2_moves = 0
-    if "random_numbers_1" not in st.session_state:
-        st.session_state.random_numbers_1 = []
-    if "random_numbers_2" not in st.session_state:
-        st.session_state.random_numbers_2 = []
-    if "data_for_excel_1" not in st.session_state:
-        st.session_state.data_for_excel_1 = []
-    if "data_for_excel_2" not in st.session_state:
-        st.session_state.data_for_excel_2 = []
-    if "data_for_condition_1" not in st.session_state:
-        st.session_state.data_for_condition_1 = []
-    if "data_for_condition_2" not in st.session_state:
-        st.session_state.data_for_condition_2 = []
+    if "trials_1" not in st.session_state:
+        st.session_state.trials_1 = TrialStore(TRIAL_SIZE)
+    if "trials_2" not in st.session_state:
+        st.session_state.trials_2 = TrialStore(TRIAL_SIZE)
+    if "tick_times" not in st.session_state:
+        st.session_state.tick_times = []  # (tick, due, started) of every tick, as Unix times
+    if "race_id" not in st.session_state:
+        st.session_state.race_id = None  # Identifies the race in the race log and in Sheets
+    if "trial_sources" not in st.session_state:
+        st.session_state.trial_sources = []  # (serial number, offset) of both trials of every tick, None if local
+    if "trial_batch" not in st.session_state:
+        st.session_state.trial_batch = None  # Evaluated trials not played yet, kept across reruns
+
+    if "carried_trials" not in st.session_state:
+        st.session_state.carried_trials = None  # Trials left unplayed by the last race, played first by the next one
+    if "threshold_mode" not in st.session_state:
+        st.session_state.threshold_mode = EMPIRICAL  # Threshold mode of the current race, see race_engine
+    if "entropy_threshold_1" not in st.session_state:
+        st.session_state.entropy_threshold_1 = threshold_tracker(st.session_state.threshold_mode, TRIAL_SIZE)
+    if "entropy_threshold_2" not in st.session_state:
+        st.session_state.entropy_threshold_2 = threshold_tracker(st.session_state.threshold_mode, TRIAL_SIZE)
     if "car_start_time" not in st.session_state:
         st.session_state.car_start_time = None
     if "best_time" not in st.session_state:
@@ -349,11 +438,82 @@ def main():
     if st.session_state.api_key:
         client = configure_random_org(st.session_state.api_key)
 
+    # All sessions with the same API key draw disjoint trials from one shared pool
+    entropy_pool = configure_entropy_pool(st.session_state.api_key, client) if client else None
+
+    # Each session chooses where its bits come from; the source is kept until the choice changes.
+    # The choice is locked from the start of a race until the game is reset, so a race never mixes sources.
+    race_started = st.session_state.race_id is not None
+    bit_source_choice = st.sidebar.selectbox(
+        bit_source_text, BIT_SOURCES, key="bit_source_choice", disabled=race_started
+    )
+    replay_file = None
+    if bit_source_choice == "replay":
+        replay_file = st.sidebar.file_uploader(replay_file_text, key="replay_file", disabled=race_started)
+        if replay_file is None:
+            st.sidebar.caption(replay_missing_text)
+    bit_source_key = (
+        bit_source_choice,
+        st.session_state.api_key,
+        replay_file.file_id if replay_file is not None else None,
+    )
+    if st.session_state.get("bit_source_key") != bit_source_key and not race_started:
+        try:
+            st.session_state.bit_source = configure_bit_source(
+                bit_source_choice,
+                entropy_pool,
+                st.session_state.session_id,
+                replay_file.getvalue() if replay_file is not None else None,
+            )
+        except ValueError as e:
+            st.sidebar.error(str(e))
+            st.session_state.bit_source = configure_bit_source("random.org", entropy_pool, st.session_state.session_id)
+        st.session_state.bit_source_key = bit_source_key
+        st.session_state.carried_trials = None  # Never start a race with trials of another source
+    bit_source = st.session_state.bit_source
+
+    # Takes effect at the start of the next race, so a race never mixes threshold modes
+    threshold_mode_choice = st.sidebar.selectbox(
+        threshold_mode_text,
+        THRESHOLD_MODES,
+        key="threshold_mode_choice",
+        format_func=threshold_mode_labels.get,
+        disabled=st.session_state.running,
+    )
+
     st.sidebar.markdown(api_description_text)
+    buffer_status = st.sidebar.empty()
+
+    def show_buffer_status():
+        """Show how many trials are ready, how often the pool ran dry and whether random.org is paused."""
+        if entropy_pool:
+            stats = entropy_pool.stats()
+            lines = [
+                buffer_status_text.format(stats["depth"], stats["target_depth"], stats["sessions"], stats["underruns"])
+            ]
+            service = client.stats()
+            if service["bits_left"] is not None:
+                lines.append(random_org_quota_text.format(service["bits_left"], service["requests_left"]))
+            if service["state"] != CLOSED:
+                lines.append(random_org_paused_text.format(service["retry_after"], service["last_error"]))
+            buffer_status.caption("  \n".join(lines))
+
+    show_buffer_status()
 
     download_menu = st.sidebar.expander("Download")
     with download_menu:
-        download_button = st.button(download_data_text, key="download_button")
+        export_format = st.selectbox(export_format_text, list(EXPORT_FORMATS), key="export_format")
+        # The file is built in memory, only when the button is clicked
+        export_trials_1 = st.session_state.trials_1
+        export_trials_2 = st.session_state.trials_2
+        st.download_button(
+            label=download_data_text,
+            data=lambda: export_trials(export_trials_1, export_trials_2, export_format),
+            file_name=f"random_numbers.{export_format}",
+            mime=EXPORT_FORMATS[export_format][0],
+            on_click="ignore",
+            key="download_button",
+        )
     reset_button = st.sidebar.button(reset_game_text, key="reset_button")
 
     # Default move multiplier set to 50 instead of 20
@@ -361,29 +521,33 @@ def main():
         move_multiplier_text, min_value=1, max_value=100, value=50, key="move_multiplier"
     )
 
+    tick_metrics = get_tick_metrics()
+    show_diagnostics = st.sidebar.checkbox(diagnostics_text, key="show_diagnostics")
+    diagnostics_placeholder = st.sidebar.empty()
+
+    def display_diagnostics():
+        """Show the tick timing histograms and counters in the sidebar."""
+        if show_diagnostics:
+            rows, counters = tick_metrics.summary()
+            with diagnostics_placeholder.container():
+                st.dataframe(rows, hide_index=True)
+                st.caption(diagnostics_counters_text.format(**counters))
+                throughput = bit_source.throughput()
+                if throughput is not None:
+                    st.caption(bit_source_throughput_text.format(bit_source.label(), throughput / 1e6))
+                st.caption(asset_memory_text.format(load_assets().nbytes() / 1024))
+
+    display_diagnostics()
+
     # Add email reference at the bottom of the sidebar
     st.sidebar.markdown(f"### {email_ref_text}")
 
-    image_dir = os.path.abspath(os.path.dirname(__file__))
-    car_image = Image.open(os.path.join(image_dir, "car.png")).resize((150, 150))  # Red car
-    car2_image = Image.open(os.path.join(image_dir, "car2.png")).resize((150, 150))  # Green car
-    flag_image = Image.open(os.path.join(image_dir, "bandierina.png")).resize(
-        (150, 150)
-    )  # Flag of the same size as the cars
-
-    # Load images for numbers and resize further to 120x120 pixels
-    number_0_green_image = Image.open(os.path.join(image_dir, "0green.png")).resize(
-        (120, 120)
-    )  # Slightly larger
-    number_1_green_image = Image.open(os.path.join(image_dir, "1green.png")).resize(
-        (120, 120)
-    )  # Slightly larger
-    number_0_red_image = Image.open(os.path.join(image_dir, "0red.png")).resize(
-        (120, 120)
-    )  # Slightly larger
-    number_1_red_image = Image.open(os.path.join(image_dir, "1red.png")).resize(
-        (120, 120)
-    )  # Slightly larger
+    # Images are decoded and encoded once per process and sent to the track once per run
+    assets = load_assets()
+    number_0_green_image = assets.digit_name(0, "green")
+    number_1_green_image = assets.digit_name(1, "green")
+    number_0_red_image = assets.digit_name(0, "red")
+    number_1_red_image = assets.digit_name(1, "red")
 
     st.write(choose_bit_text)
 
@@ -432,62 +596,48 @@ def main():
     <style>
     div.stButton > button[title="Scegli il bit 1"] { background-color: #90EE90; }
     div.stButton > button[title="Scegli il bit 0"] { background-color: #FFB6C1; }
-    .number-image.show {
-        display: block;
-    }
     </style>
     """
     if st.session_state.player_choice == 1 or st.session_state.player_choice == 0:
         st.markdown(active_button_style, unsafe_allow_html=True)
 
-    car_image_base64 = image_to_base64(car_image)
-    car2_image_base64 = image_to_base64(car2_image)
-    flag_image_base64 = image_to_base64(flag_image)
-    red_car_number_base64 = image_to_base64(red_car_number_image)
-    green_car_number_base64 = image_to_base64(green_car_number_image)
-
-    car_placeholder = st.empty()
-    car2_placeholder = st.empty()
-
-    def display_cars():
-        """Display the cars and the images of the selected numbers."""
-        car_placeholder.markdown(
-            f"""
-            <div class="slider-container first">
-                <!-- Car image and position -->
-                <img src="data:image/png;base64,{car_image_base64}" class="car-image" style="left:calc(-71px + {st.session_state.car_pos / 10}%)">
-                <!-- Red car number image -->
-                <img src="data:image/png;base64,{red_car_number_base64}" class="number-image {'show' if st.session_state.player_choice is not None else ''}" 
-                     style="left:calc(-43px + {st.session_state.car_pos / 10}%); top: 34px; z-index: 10;">
-                <input type="range" min="0" max="1000" value="{st.session_state.car_pos}" disabled>
-                <img src="data:image/png;base64,{flag_image_base64}" class="flag-image">
-            </div>
-        """,
-            unsafe_allow_html=True,
-        )
+    track_placeholder = st.empty()
+    track_assets_sent = False
+    track_renders = 0
 
-        car2_placeholder.markdown(
-            f"""
-            <div class="slider-container">
-                <!-- Green car image and position -->
-                <img src="data:image/png;base64,{car2_image_base64}" class="car-image" style="left:calc(-71px + {st.session_state.car2_pos / 10}%)">
-                <!-- Green car number image -->
-                <img src="data:image/png;base64,{green_car_number_base64}" class="number-image {'show' if st.session_state.player_choice is not None else ''}" 
-                     style="left:calc(-43px + {st.session_state.car2_pos / 10}%); top: 34px; z-index: 10;">
-                <input type="range" min="0" max="1000" value="{st.session_state.car2_pos}" disabled>
-                <img src="data:image/png;base64,{flag_image_base64}" class="flag-image">
-            </div>
-        """,
-            unsafe_allow_html=True,
-        )
+    def display_cars(moved=(False, False)):
+        """Display the cars and the images of the selected numbers.
+
+        The image encodings go to the browser with the first render of each run;
+        every later render only sends the positions and move flags.
+        """
+        nonlocal track_assets_sent, track_renders
+        show_numbers = st.session_state.player_choice is not None
+        track_renders += 1
+        with track_placeholder:
+            race_track(
+                track_cars(
+                    st.session_state.car_pos,
+                    st.session_state.car2_pos,
+                    moved,
+                    red_car_number_image if show_numbers else None,
+                    green_car_number_image if show_numbers else None,
+                ),
+                asset_version=assets.version(),
+                assets=None if track_assets_sent else assets.encodings(),
+                interval=REQUEST_INTERVAL,
+                tick=track_renders,
+            )
+        track_assets_sent = True
 
     display_cars()
 
     def check_winner():
         """Check if there is a winner."""
-        if st.session_state.car_pos >= 900:  # Shorten the track to leave room for the flag
+        winner = race_winner(st.session_state.car_pos, st.session_state.car2_pos)
+        if winner == RED:
             return "Rossa" if st.session_state.language == "Italiano" else "Red"
-        elif st.session_state.car2_pos >= 900:  # Shorten the track to leave room for the flag
+        elif winner == GREEN:
             return "Verde" if st.session_state.language == "Italiano" else "Green"
         return None
 
@@ -499,10 +649,14 @@ def main():
         show_retry_popup()
 
         # Calculate the sums for red and green car
-        red_car_0s = st.session_state.random_numbers_1.count(0)
-        red_car_1s = st.session_state.random_numbers_1.count(1)
-        green_car_0s = st.session_state.random_numbers_2.count(0)
-        green_car_1s = st.session_state.random_numbers_2.count(1)
+        red_car_0s = st.session_state.trials_1.zeros
+        red_car_1s = st.session_state.trials_1.ones
+        green_car_0s = st.session_state.trials_2.zeros
+        green_car_1s = st.session_state.trials_2.ones
+
+        # A race can end in the middle of a batch; its unplayed trials open the next race of this session
+        trial_batch = st.session_state.trial_batch
+        unplayed_sources = trial_batch.unplayed_sources() if trial_batch is not None else []
 
         # Save race data to Google Sheets
         race_data = [
@@ -519,9 +673,16 @@ def main():
             green_car_0s,
             green_car_1s,
             st.session_state.car1_moves,  # Number of moves by red car
-            st.session_state.car2_moves  # Number of moves by green car
+            st.session_state.car2_moves,  # Number of moves by green car
+            json.dumps(random_org_serials(st.session_state.trial_sources)),  # random.org responses used
+            bit_source.label(),  # Source of the bits, with the seed or file digest needed to replay it
+            f"{st.session_state.race_id:016x}",  # Race id in the race log, at RACE_ID_COLUMN
+            st.session_state.threshold_mode,  # "empirical" or "analytic" threshold
+            json.dumps(random_org_segments(unplayed_sources)),  # random.org trials fetched but never played
         ]
-        save_race_data(sheet1, race_data)
+        save_race_data(race_data)
+        if trial_archive:
+            trial_archive.request_flush()  # Make the finished race queryable without waiting for the next flush
 
     def reset_game():
         """Reset the game state."""
@@ -529,12 +690,17 @@ def main():
         st.session_state.car2_pos = 50
         st.session_state.car1_moves = 0
         st.session_state.car2_moves = 0
-        st.session_state.data_for_excel_1 = []
-        st.session_state.data_for_excel_2 = []
-        st.session_state.data_for_condition_1 = []
-        st.session_state.data_for_condition_2 = []
-        st.session_state.random_numbers_1 = []
-        st.session_state.random_numbers_2 = []
+        st.session_state.trials_1 = TrialStore(TRIAL_SIZE)
+        st.session_state.trials_2 = TrialStore(TRIAL_SIZE)
+        st.session_state.tick_times = []
+        st.session_state.trial_sources = []
+        st.session_state.race_id = None
+        trial_batch = st.session_state.trial_batch
+        if trial_batch is not None and trial_batch.remaining():
+            st.session_state.carried_trials = trial_batch.unplayed()
+        st.session_state.trial_batch = None
+        st.session_state.entropy_threshold_1 = threshold_tracker(st.session_state.threshold_mode, TRIAL_SIZE)
+        st.session_state.entropy_threshold_2 = threshold_tracker(st.session_state.threshold_mode, TRIAL_SIZE)
         st.session_state.widget_key_counter += 1
         st.session_state.player_choice = None
         st.session_state.running = False
@@ -551,93 +717,159 @@ def main():
             except Exception:
                 pass  # Silence the duplicate widget key exception
 
-    # Connect to Google Sheets
-    sheet1 = configure_google_sheets("test")
+    trial_evaluator = TrialEvaluator(TRIAL_SIZE)
 
     if start_button and st.session_state.player_choice is not None:
         st.session_state.running = True
         st.session_state.car_start_time = time.time()
+        if st.session_state.race_id is None:
+            st.session_state.race_id = int.from_bytes(os.urandom(8), "little")
+            st.session_state.threshold_mode = threshold_mode_choice
+            st.session_state.entropy_threshold_1 = threshold_tracker(threshold_mode_choice, TRIAL_SIZE)
+            st.session_state.entropy_threshold_2 = threshold_tracker(threshold_mode_choice, TRIAL_SIZE)
         st.session_state.show_retry_popup = False
 
     if stop_button:
         st.session_state.running = False
 
+    def fetch_batch(car):
+        """Fetch the next batch of trials of one car and record how long it took."""
+        fetch_start = time.perf_counter()
+        result = bit_source.take_batch(car, TRIAL_BATCH, TRIAL_SIZE)
+        tick_metrics.observe(f"fetch_{car + 1}", time.perf_counter() - fetch_start)
+        return result
+
+    trial_fetcher = get_trial_fetcher()
+    race_log = get_race_log()
+    trial_archive = get_trial_archive()
+    scheduler = TickScheduler(REQUEST_INTERVAL, TICK_POLICY)
+    ticks_run = 0
     try:
         while st.session_state.running:
-            start_time = time.time()
-
-            # Get random numbers from random.org
-            random_bits_1, random_org_success_1 = get_random_bits_from_random_org(
-                1000, client
-            )
-            random_bits_2, random_org_success_2 = get_random_bits_from_random_org(
-                1000, client
-            )
-
-            if not random_org_success_1 and not random_org_success_2:
+            # Ticks follow a fixed-rate schedule, so a late tick shortens the next wait
+            scheduled_tick = scheduler.wait()
+            tick_timer = tick_metrics.timer()
+            tick_metrics.observe("sleep", scheduled_tick.slept)
+            tick_metrics.observe("lateness", scheduled_tick.lateness)
+            if scheduled_tick.skipped:
+                tick_metrics.increment("skipped_ticks", scheduled_tick.skipped)
+
+            # Fetch and evaluate the trials of both cars a batch at a time, then play them one per tick.
+            # Only the ticks that build a batch time the fetch and the evaluation, so their
+            # histograms are not filled with the near-zero times of the other ticks.
+            # The first batch of a race is made of the trials the last race left unplayed, if any,
+            # evaluated against the thresholds of this race.
+            trial_batch = st.session_state.trial_batch
+            if trial_batch is None or trial_batch.remaining() == 0:
+                if trial_batch is None and st.session_state.carried_trials is not None:
+                    packed, sources = st.session_state.carried_trials
+                    st.session_state.carried_trials = None
+                else:
+                    (rows_1, sources_1), (rows_2, sources_2) = trial_fetcher.fetch(
+                        lambda: fetch_batch(0), lambda: fetch_batch(1)
+                    )
+                    tick_timer.lap("fetch")
+                    packed, sources = np.stack([rows_1, rows_2]), (sources_1, sources_2)
+                trial_batch = TrialBatch(
+                    packed,
+                    sources,
+                    trial_evaluator,
+                    (st.session_state.entropy_threshold_1, st.session_state.entropy_threshold_2),
+                )
+                st.session_state.trial_batch = trial_batch
+                tick_timer.lap("evaluate_batch")
+            trial = trial_batch.next_trial(st.session_state.player_choice, st.session_state.move_multiplier)
+            packed_bits_1, packed_bits_2 = trial["packed"]
+            count_1, count_ones_2 = trial["counts"]
+            entropy_score_1, entropy_score_2 = trial["entropies"]
+            percentile_5_1, percentile_5_2 = trial["thresholds"]
+            source_1, source_2 = trial["sources"]
+            random_org_success_1 = source_1 is not None
+            random_org_success_2 = source_2 is not None
+
+            if bit_source.remote and not random_org_success_1 and not random_org_success_2:
                 # Only show warning once if random.org fails
                 if not st.session_state.warned_random_org:
                     st.session_state.warned_random_org = True
+            if bit_source.remote and entropy_pool:
+                tick_metrics.increment("local_fallbacks", (not random_org_success_1) + (not random_org_success_2))
 
-            st.session_state.random_numbers_1.extend(random_bits_1)
-            st.session_state.random_numbers_2.extend(random_bits_2)
-
-            st.session_state.data_for_excel_1.append(random_bits_1)
-            st.session_state.data_for_excel_2.append(random_bits_2)
-
-            entropy_score_1 = calculate_entropy(random_bits_1)
-            entropy_score_2 = calculate_entropy(random_bits_2)
-
-            st.session_state.data_for_condition_1.append(entropy_score_1)
-            st.session_state.data_for_condition_2.append(entropy_score_2)
-
-            percentile_5_1 = np.percentile(st.session_state.data_for_condition_1, 5)
-            percentile_5_2 = np.percentile(st.session_state.data_for_condition_2, 5)
-
-            count_1 = sum(random_bits_1)
-            count_0 = len(random_bits_1) - count_1
-
-            if entropy_score_1 < percentile_5_1:
-                if st.session_state.player_choice == 1 and count_1 > count_0:
-                    st.session_state.car2_pos = move_car(
-                        st.session_state.car2_pos,
-                        st.session_state.move_multiplier
-                        * (1 + ((percentile_5_1 - entropy_score_1) / percentile_5_1)),
-                    )
-                    st.session_state.car1_moves += 1
-                elif st.session_state.player_choice == 0 and count_0 > count_1:
-                    st.session_state.car2_pos = move_car(
-                        st.session_state.car2_pos,
-                        st.session_state.move_multiplier
-                        * (1 + ((percentile_5_1 - entropy_score_1) / percentile_5_1)),
-                    )
-                    st.session_state.car1_moves += 1
-
-            if entropy_score_2 < percentile_5_2:
-                if st.session_state.player_choice == 1 and count_0 > count_1:
-                    st.session_state.car_pos = move_car(
-                        st.session_state.car_pos,
-                        st.session_state.move_multiplier
-                        * (1 + ((percentile_5_2 - entropy_score_2) / percentile_5_2)),
-                    )
-                    st.session_state.car2_moves += 1
-                elif st.session_state.player_choice == 0 and count_1 > count_0:
-                    st.session_state.car_pos = move_car(
-                        st.session_state.car_pos,
-                        st.session_state.move_multiplier
-                        * (1 + ((percentile_5_2 - entropy_score_2) / percentile_5_2)),
-                    )
-                    st.session_state.car2_moves += 1
-
-            display_cars()
+            st.session_state.trials_1.append_packed(packed_bits_1, count_1)
+            st.session_state.trials_2.append_packed(packed_bits_2, count_ones_2)
+            st.session_state.tick_times.append(
+                (len(st.session_state.tick_times), scheduled_tick.due, scheduled_tick.started)
+            )
+            st.session_state.trial_sources.append((source_1, source_2))
+            tick_timer.lap("store")  # Taking the next trial from the batch and recording it
+
+            previous_positions = (st.session_state.car_pos, st.session_state.car2_pos)
+
+            red_distance, green_distance = trial["red_distance"], trial["green_distance"]
+            if green_distance is not None:
+                st.session_state.car2_pos = move_car(st.session_state.car2_pos, green_distance)
+                st.session_state.car1_moves += 1
+            if red_distance is not None:
+                st.session_state.car_pos = move_car(st.session_state.car_pos, red_distance)
+                st.session_state.car2_moves += 1
+            tick_timer.lap("move")
+
+            race_log.append(
+                st.session_state.race_id,
+                len(st.session_state.trials_1) - 1,
+                st.session_state.player_choice,
+                st.session_state.move_multiplier,
+                st.session_state.threshold_mode,
+                scheduled_tick.due,
+                scheduled_tick.started,
+                (packed_bits_1, packed_bits_2),
+                (count_1, count_ones_2),
+                (entropy_score_1, entropy_score_2),
+                (percentile_5_1, percentile_5_2),
+                (green_distance, red_distance),
+                st.session_state.car_pos,
+                st.session_state.car2_pos,
+            )
+            if trial_archive:
+                trial_archive.append(
+                    st.session_state.session_id,
+                    st.session_state.race_id,
+                    len(st.session_state.trials_1) - 1,
+                    scheduled_tick.started,
+                    st.session_state.player_choice,
+                    st.session_state.move_multiplier,
+                    (packed_bits_1, packed_bits_2),
+                    (count_1, count_ones_2),
+                    (entropy_score_1, entropy_score_2),
+                    (percentile_5_1, percentile_5_2),
+                    (green_distance, red_distance),
+                    (source_1, source_2),
+                    bit_source.name,
+                )
+            tick_timer.lap("log")
+
+            display_cars(
+                moved=(
+                    st.session_state.car_pos != previous_positions[0],
+                    st.session_state.car2_pos != previous_positions[1],
+                )
+            )
+            show_buffer_status()
+            tick_timer.lap("display")
+            tick_metrics.increment("ticks")
+            ticks_run += 1
+            if ticks_run % DIAGNOSTICS_REFRESH_TICKS == 0:
+                display_diagnostics()
 
             winner = check_winner()
             if winner:
                 end_race(winner)
                 break
 
-            time_elapsed = time.time() - start_time
-            time.sleep(max(REQUEST_INTERVAL - time_elapsed, 0))
+            time_elapsed = tick_timer.elapsed()
+            if time_elapsed > REQUEST_INTERVAL:
+                tick_metrics.increment("interval_overruns")
+            tick_metrics.observe("tick", time_elapsed)
+            tick_metrics.write_every(METRICS_PATH, METRICS_EXPORT_INTERVAL)
 
         if st.session_state.show_retry_popup:
             show_retry_popup()
@@ -645,29 +877,6 @@ def main():
     except Exception as e:
         pass  # Silence any other errors
 
-    if download_button:
-        # Create DataFrame with "Green Car" and "Red Car" columns
-        df = pd.DataFrame(
-            {
-                "Green Car": [
-                    "".join(map(str, row))
-                    for row in st.session_state.data_for_excel_1
-                ],
-                "Red Car": [
-                    "".join(map(str, row))
-                    for row in st.session_state.data_for_excel_2
-                ],
-            }
-        )
-        df.to_excel("random_numbers.xlsx", index=False)
-        with open("random_numbers.xlsx", "rb") as file:
-            st.download_button(
-                label=download_data_text,
-                data=file,
-                file_name="random_numbers.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            )
-
     if reset_button:
         reset_game()
 
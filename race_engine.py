@@ -0,0 +1,379 @@
+import numpy as np
+
+from entropy_stats import (
+    BinomialPercentile,
+    EntropyPercentile,
+    TrialEvaluator,
+    binomial_crossing_rate,
+    binomial_entropy_percentile,
+    entropy_by_count,
+    interpolate_percentile,
+    majority_bits,
+    pack_bits,
+    popcount_rows,
+)
+
+START_POSITION = 50
+FINISH_LINE = 900  # Shorten the track to leave room for the flag
+THRESHOLD_PERCENTILE = 5
+EMPIRICAL = "empirical"  # Threshold from the entropies of the race so far
+ANALYTIC = "analytic"  # Threshold from the exact entropy distribution of fair bits
+THRESHOLD_MODES = (EMPIRICAL, ANALYTIC)
+RED = "red"
+GREEN = "green"
+
+
+def threshold_tracker(mode=EMPIRICAL, trial_size=1000):
+    """Return the 5th percentile threshold of one car for a threshold mode."""
+    if mode == EMPIRICAL:
+        return EntropyPercentile(trial_size, THRESHOLD_PERCENTILE)
+    if mode == ANALYTIC:
+        return BinomialPercentile(trial_size, THRESHOLD_PERCENTILE)
+    raise ValueError(f"Unknown threshold mode {mode!r}")
+
+
+def expected_crossing_rate(mode=EMPIRICAL, trial_size=1000):
+    """Return the share of fair trials expected below the threshold of a mode.
+
+    The empirical threshold follows the race history, so about 5% of its trials
+    fall below it. The analytic cutoff is a fixed entropy, and the trials
+    strictly below it have an exact probability that falls a little short of 5%.
+    """
+    if mode == ANALYTIC:
+        return binomial_crossing_rate(trial_size, THRESHOLD_PERCENTILE)
+    return THRESHOLD_PERCENTILE / 100
+
+
+def move_car(car_pos, distance):
+    """Move the car a certain distance."""
+    car_pos += distance
+    if car_pos > FINISH_LINE:
+        car_pos = FINISH_LINE
+    return car_pos
+
+
+def move_distance(move_multiplier, entropy, threshold):
+    """Distance = Multiplier × (1 + ((percentile - entropy) / percentile))."""
+    return move_multiplier * (1 + ((threshold - entropy) / threshold))
+
+
+def decide_moves(player_choice, move_multiplier, majority_1, entropy_1, threshold_1, entropy_2, threshold_2):
+    """Return the distances moved by the red and the green car in one tick, or None if a car stays.
+
+    The green car follows the first trial and the red car the second one. As in
+    the original game, both cars compare against the majority bit of the first trial.
+    """
+    red_distance = None
+    green_distance = None
+    if entropy_1 < threshold_1 and majority_1 == player_choice:
+        green_distance = move_distance(move_multiplier, entropy_1, threshold_1)
+    if entropy_2 < threshold_2 and majority_1 == 1 - player_choice:
+        red_distance = move_distance(move_multiplier, entropy_2, threshold_2)
+    return red_distance, green_distance
+
+
+def race_winner(car_pos, car2_pos):
+    """Return RED or GREEN if a car reached the finish line, otherwise None."""
+    if car_pos >= FINISH_LINE:
+        return RED
+    elif car2_pos >= FINISH_LINE:
+        return GREEN
+    return None
+
+
+class RaceEngine:
+    """State and rules of a single race, independent of Streamlit."""
+
+    def __init__(self, player_choice, move_multiplier, trial_size=1000, threshold_mode=EMPIRICAL):
+        self.player_choice = player_choice
+        self.move_multiplier = move_multiplier
+        self.trial_size = trial_size
+        self.threshold_mode = threshold_mode
+        self.evaluator = TrialEvaluator(trial_size)
+        self.thresholds = (
+            threshold_tracker(threshold_mode, trial_size),
+            threshold_tracker(threshold_mode, trial_size),
+        )
+        self.car_pos = START_POSITION  # Red car
+        self.car2_pos = START_POSITION  # Green car
+        self.car1_moves = 0  # Moves driven by the first trial
+        self.car2_moves = 0  # Moves driven by the second trial
+        self.ticks = 0
+        self.winner = None
+
+    def step_counts(self, count_1, count_ones_2):
+        """Play one tick from the number of ones in each trial."""
+        _, entropy_1, majority_1 = self.evaluator.evaluate_count(count_1)
+        _, entropy_2, _ = self.evaluator.evaluate_count(count_ones_2)
+        self.thresholds[0].add(count_1)
+        self.thresholds[1].add(count_ones_2)
+        red_distance, green_distance = decide_moves(
+            self.player_choice,
+            self.move_multiplier,
+            majority_1,
+            entropy_1,
+            self.thresholds[0].percentile(),
+            entropy_2,
+            self.thresholds[1].percentile(),
+        )
+        if green_distance is not None:
+            self.car2_pos = move_car(self.car2_pos, green_distance)
+            self.car1_moves += 1
+        if red_distance is not None:
+            self.car_pos = move_car(self.car_pos, red_distance)
+            self.car2_moves += 1
+        self.ticks += 1
+        self.winner = race_winner(self.car_pos, self.car2_pos)
+        return red_distance, green_distance
+
+    def step(self, bits_1, bits_2):
+        """Play one tick from the bits of both trials."""
+        count_1 = self.evaluator.evaluate_packed(pack_bits(bits_1))[0]
+        count_ones_2 = self.evaluator.evaluate_packed(pack_bits(bits_2))[0]
+        return self.step_counts(count_1, count_ones_2)
+
+    def result(self):
+        """Return the outcome of the race so far."""
+        return {
+            "winner": self.winner,
+            "ticks": self.ticks,
+            "car_pos": self.car_pos,
+            "car2_pos": self.car2_pos,
+            "car1_moves": self.car1_moves,
+            "car2_moves": self.car2_moves,
+        }
+
+
+class TrialBatch:
+    """Trials of both cars evaluated together and played one per tick.
+
+    packed holds the bits shaped (cars, trials, bytes); index 0 is the first
+    trial, which drives the green car. Counts, entropies, thresholds and moves
+    of every trial come from one pass over the arrays, with the same results as
+    decide_moves trial by trial. Building a batch records its trials in the
+    threshold histograms, so batches must be played in the order they are built.
+    """
+
+    def __init__(self, packed, sources, evaluator, thresholds):
+        self.packed = packed
+        self.sources = sources  # Provenance of each trial of each car, None for local bits
+        self.counts = popcount_rows(packed)
+        self.entropies = evaluator.entropy_array[self.counts]
+        self.thresholds = np.stack([
+            threshold.add_many(counts) for threshold, counts in zip(thresholds, self.counts)
+        ])
+        self.majority_1 = majority_bits(self.counts[0], evaluator.trial_size)
+        self.position = 0  # Next trial to play
+        self._moves = None
+        self._moves_key = None
+        self._trial_moves = None
+        self._trials = None
+
+    def __len__(self):
+        return self.packed.shape[1]
+
+    def remaining(self):
+        """Return the number of trials not played yet."""
+        return len(self) - self.position
+
+    def unplayed_sources(self):
+        """Return the provenance of both cars for each trial not played yet, as next_trial would."""
+        return list(zip(*(sources[self.position:] for sources in self.sources)))
+
+    def unplayed(self):
+        """Return the packed trials and the provenance of each car not played yet, to build the next batch from."""
+        return self.packed[:, self.position:], tuple(sources[self.position:] for sources in self.sources)
+
+    def moves(self, player_choice, move_multiplier):
+        """Return the distances of the red and the green car at every trial, NaN where a car stays.
+
+        The player can change the multiplier during a race, so the distances
+        are recomputed when it differs from the last call.
+        """
+        key = (player_choice, move_multiplier)
+        if key != self._moves_key:
+            green = (self.entropies[0] < self.thresholds[0]) & (self.majority_1 == player_choice)
+            red = (self.entropies[1] < self.thresholds[1]) & (self.majority_1 == 1 - player_choice)
+            distances = move_multiplier * (1 + ((self.thresholds - self.entropies) / self.thresholds))
+            self._moves = (np.where(red, distances[1], np.nan), np.where(green, distances[0], np.nan))
+            # Python values for the tick loop, which reads one trial at a time
+            self._trial_moves = [
+                (red_distance if moved_red else None, green_distance if moved_green else None)
+                for red_distance, green_distance, moved_red, moved_green in zip(
+                    distances[1].tolist(), distances[0].tolist(), red.tolist(), green.tolist()
+                )
+            ]
+            self._moves_key = key
+        return self._moves
+
+    def next_trial(self, player_choice, move_multiplier):
+        """Return the next trial of both cars and the distances moved, None for a car that stays."""
+        index = self.position
+        self.position += 1
+        self.moves(player_choice, move_multiplier)
+        if self._trials is None:
+            self._trials = list(zip(
+                zip(self.packed[0], self.packed[1]),
+                zip(*self.counts.tolist()),
+                zip(*self.entropies.tolist()),
+                zip(*self.thresholds.tolist()),
+                zip(*self.sources),
+            ))
+        packed, counts, entropies, thresholds, sources = self._trials[index]
+        red_distance, green_distance = self._trial_moves[index]
+        return {
+            "packed": packed,
+            "counts": counts,
+            "entropies": entropies,
+            "thresholds": thresholds,
+            "sources": sources,
+            "red_distance": red_distance,
+            "green_distance": green_distance,
+        }
+
+
+def replay_race(trials_1, trials_2, player_choice, move_multiplier, trial_size=1000, threshold_mode=EMPIRICAL):
+    """Replay a race from the recorded trials of both cars, stopping at the winner."""
+    engine = RaceEngine(player_choice, move_multiplier, trial_size, threshold_mode)
+    for bits_1, bits_2 in zip(trials_1, trials_2):
+        engine.step(bits_1, bits_2)
+        if engine.winner:
+            break
+    return engine.result()
+
+
+def _insert_sorted(lowest, values):
+    """Insert one value per row into ascending rows, replacing the largest value of each row.
+
+    Every value must be smaller than the last value of its row.
+    """
+    lowest = lowest.copy()
+    lowest[:, -1] = values
+    lowest.sort(axis=1)
+    return lowest
+
+
+def _batch_percentile(lowest, n, q):
+    """Percentile of the first n values of every row, as computed by np.percentile."""
+    virtual_index = (n - 1) * q
+    if virtual_index >= n - 1:
+        return lowest[:, n - 1]
+    rank = int(virtual_index)
+    return interpolate_percentile(lowest[:, rank], lowest[:, rank + 1], virtual_index - rank)
+
+
+def simulate_races(num_races, move_multiplier, player_choice=1, trial_size=1000, max_ticks=2000, rng=None,
+                   threshold_mode=EMPIRICAL):
+    """Simulate many races at once with fair random bits.
+
+    Only the number of ones of each trial matters to the rules, so trials are
+    drawn from the binomial distribution and all races advance together. Each
+    race keeps the lowest entropies it has seen, which is all the 5th
+    percentile threshold needs; the analytic threshold needs none. Races still
+    running after max_ticks are reported without a winner.
+    """
+    if threshold_mode not in THRESHOLD_MODES:
+        raise ValueError(f"Unknown threshold mode {threshold_mode!r}")
+    rng = np.random.default_rng(rng)
+    q = THRESHOLD_PERCENTILE / 100
+    table = np.array(entropy_by_count(trial_size))
+    kept = int((max_ticks - 1) * q) + 2  # Lowest entropies needed by the last tick
+    analytic_threshold = None
+    if threshold_mode == ANALYTIC:
+        analytic_threshold = binomial_entropy_percentile(trial_size, THRESHOLD_PERCENTILE)
+
+    result = {
+        "ticks": np.full(num_races, max_ticks, dtype=np.int64),
+        "winner": np.full(num_races, None, dtype=object),
+        "car_pos": np.full(num_races, START_POSITION, dtype=float),
+        "car2_pos": np.full(num_races, START_POSITION, dtype=float),
+        "car1_moves": np.zeros(num_races, dtype=np.int64),
+        "car2_moves": np.zeros(num_races, dtype=np.int64),
+    }
+
+    # State of the races still running, compacted as races finish
+    ids = np.arange(num_races)
+    lowest = [np.full((num_races, kept), np.inf), np.full((num_races, kept), np.inf)]
+    car_pos = result["car_pos"].copy()
+    car2_pos = result["car2_pos"].copy()
+    car1_moves = result["car1_moves"].copy()
+    car2_moves = result["car2_moves"].copy()
+    running = np.ones(num_races, dtype=bool)
+
+    def store(rows):
+        result["car_pos"][ids[rows]] = car_pos[rows]
+        result["car2_pos"][ids[rows]] = car2_pos[rows]
+        result["car1_moves"][ids[rows]] = car1_moves[rows]
+        result["car2_moves"][ids[rows]] = car2_moves[rows]
+
+    for tick in range(max_ticks):
+        if not running.any():
+            break
+        counts = rng.binomial(trial_size, 0.5, size=(2, len(ids)))
+        entropies = table[counts]
+        thresholds = np.empty_like(entropies)
+        for car in range(2):
+            if threshold_mode == ANALYTIC:
+                thresholds[car] = analytic_threshold
+                continue
+            # Only rows where the new entropy enters the kept tail change
+            rows = np.flatnonzero(entropies[car] < lowest[car][:, -1])
+            lowest[car][rows] = _insert_sorted(lowest[car][rows], entropies[car][rows])
+            thresholds[car] = _batch_percentile(lowest[car], tick + 1, q)
+
+        count_0 = trial_size - counts[0]
+        majority_1 = np.where(counts[0] > count_0, 1, np.where(count_0 > counts[0], 0, -1))
+        green_moves = running & (entropies[0] < thresholds[0]) & (majority_1 == player_choice)
+        red_moves = running & (entropies[1] < thresholds[1]) & (majority_1 == 1 - player_choice)
+        distances = move_multiplier * (1 + ((thresholds - entropies) / thresholds))
+
+        car2_pos = np.where(green_moves, np.minimum(car2_pos + distances[0], FINISH_LINE), car2_pos)
+        car_pos = np.where(red_moves, np.minimum(car_pos + distances[1], FINISH_LINE), car_pos)
+        car1_moves += green_moves
+        car2_moves += red_moves
+
+        red_wins = running & (car_pos >= FINISH_LINE)
+        green_wins = running & ~red_wins & (car2_pos >= FINISH_LINE)
+        finished = red_wins | green_wins
+        if finished.any():
+            result["winner"][ids[red_wins]] = RED
+            result["winner"][ids[green_wins]] = GREEN
+            result["ticks"][ids[finished]] = tick + 1
+            store(finished)
+            running &= ~finished
+            # Drop finished races once they make up a good share of the arrays
+            if running.sum() * 4 < len(running) * 3:
+                keep = np.flatnonzero(running)
+                ids, car_pos, car2_pos = ids[keep], car_pos[keep], car2_pos[keep]
+                car1_moves, car2_moves = car1_moves[keep], car2_moves[keep]
+                lowest = [lowest[0][keep], lowest[1][keep]]
+                running = running[keep]
+
+    store(running)
+    winner = result["winner"]
+    result["win_rate"] = {
+        RED: float(np.mean(winner == RED)),
+        GREEN: float(np.mean(winner == GREEN)),
+        None: float(np.mean(winner == None)),  # noqa: E711
+    }
+    return result
+
+
+def summarize_simulation(result, interval=0.5):
+    """Summarize simulated races: duration, move counts and win rates."""
+    finished = result["winner"] != None  # noqa: E711
+    ticks = result["ticks"][finished]
+    summary = {"races": len(result["ticks"]), "win_rate": result["win_rate"]}
+    if len(ticks):
+        summary["ticks"] = {
+            "mean": float(ticks.mean()),
+            "median": float(np.median(ticks)),
+            "p5": float(np.percentile(ticks, 5)),
+            "p95": float(np.percentile(ticks, 95)),
+        }
+        summary["duration_seconds"] = {key: value * interval for key, value in summary["ticks"].items()}
+    summary["moves"] = {
+        "car1_mean": float(result["car1_moves"].mean()),
+        "car2_mean": float(result["car2_moves"].mean()),
+    }
+    return summary
@@ -0,0 +1,128 @@
+"""Export of the trials of a race, built in memory.
+
+Formats:
+    xlsx     one row per trial with the bits of each car as text, written with
+             the openpyxl write-only workbook
+    csv      the same rows as comma-separated text
+    parquet  one row per trial with the packed bits of each car (needs pyarrow)
+    bin      the packed bits after a small header, see pack_header
+
+Packed bits follow np.packbits: the first bit of a trial is the most
+significant bit of its first byte, and the last byte is padded with zeros.
+"""
+import io
+import struct
+from importlib.util import find_spec
+
+import numpy as np
+
+# openpyxl and pyarrow are imported by their writers, so the app starts without them
+HAS_PYARROW = find_spec("pyarrow") is not None  # Parquet export is offered only when pyarrow is installed
+
+COLUMNS = ("Green Car", "Red Car")  # Column names of the original Excel export
+EXPORT_CHUNK = 4096  # Trials unpacked at a time
+BINARY_MAGIC = b"CMRB"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sBBII")  # Magic, version, number of cars, trial size, number of trials
+
+
+def _bit_string_chunks(trials_1, trials_2, chunk=EXPORT_CHUNK):
+    """Yield the trials of both cars as arrays of ASCII bit strings, a chunk at a time."""
+    count = min(len(trials_1), len(trials_2))
+    trial_size = trials_1.trial_size
+    packed = (trials_1.packed()[:count], trials_2.packed()[:count])
+    for start in range(0, count, chunk):
+        strings = []
+        for rows in packed:
+            bits = np.unpackbits(rows[start:start + chunk], axis=1, count=trial_size)
+            bits += ord("0")
+            strings.append(bits.view(f"S{trial_size}").ravel())
+        yield strings
+
+
+def export_xlsx(trials_1, trials_2):
+    """Return an Excel workbook with the bits of each trial as text."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append(COLUMNS)
+    for strings_1, strings_2 in _bit_string_chunks(trials_1, trials_2):
+        for bits_1, bits_2 in zip(strings_1, strings_2):
+            sheet.append((bits_1.decode("ascii"), bits_2.decode("ascii")))
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def export_csv(trials_1, trials_2):
+    """Return a CSV file with the bits of each trial as text."""
+    output = io.BytesIO()
+    output.write((",".join(COLUMNS) + "\n").encode("ascii"))
+    for strings_1, strings_2 in _bit_string_chunks(trials_1, trials_2):
+        output.write(b"".join(bits_1 + b"," + bits_2 + b"\n" for bits_1, bits_2 in zip(strings_1, strings_2)))
+    return output.getvalue()
+
+
+def export_parquet(trials_1, trials_2):
+    """Return a Parquet file with the packed bits of each trial."""
+    if not HAS_PYARROW:
+        raise RuntimeError("Parquet export requires pyarrow")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    count = min(len(trials_1), len(trials_2))
+    columns = {"Trial": pa.array(np.arange(count, dtype=np.int32))}
+    for name, trials in zip(COLUMNS, (trials_1, trials_2)):
+        rows = np.ascontiguousarray(trials.packed()[:count])
+        columns[name] = pa.FixedSizeBinaryArray.from_buffers(
+            pa.binary(trials.row_bytes), count, [None, pa.py_buffer(rows)]
+        )
+    table = pa.table(columns, metadata={"trial_size": str(trials_1.trial_size)})
+    output = io.BytesIO()
+    pq.write_table(table, output, compression="none")  # Random bits do not compress
+    return output.getvalue()
+
+
+def pack_header(trial_size, num_trials, num_cars=2):
+    """Return the header of a packed binary export."""
+    return BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, num_cars, trial_size, num_trials)
+
+
+def export_packed(trials_1, trials_2):
+    """Return the header followed by every packed trial of the first car, then of the second car."""
+    count = min(len(trials_1), len(trials_2))
+    output = io.BytesIO()
+    output.write(pack_header(trials_1.trial_size, count))
+    for trials in (trials_1, trials_2):
+        output.write(trials.packed()[:count].tobytes())
+    return output.getvalue()
+
+
+def read_packed(data):
+    """Read a packed binary export and return the trial size and the packed trials of each car."""
+    if len(data) < BINARY_HEADER.size:
+        raise ValueError("Packed race export is truncated")
+    magic, version, num_cars, trial_size, num_trials = BINARY_HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError("Not a packed race export")
+    row_bytes = (trial_size + 7) // 8
+    if len(data) - BINARY_HEADER.size != num_cars * num_trials * row_bytes:
+        raise ValueError("Packed race export does not match its header")
+    rows = np.frombuffer(data, dtype=np.uint8, offset=BINARY_HEADER.size)
+    return trial_size, rows.reshape(num_cars, num_trials, row_bytes)
+
+
+# MIME type and writer of each format by file extension, in the order offered to the user
+EXPORT_FORMATS = {
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", export_xlsx),
+    "csv": ("text/csv", export_csv),
+}
+if HAS_PYARROW:
+    EXPORT_FORMATS["parquet"] = ("application/vnd.apache.parquet", export_parquet)
+EXPORT_FORMATS["bin"] = ("application/octet-stream", export_packed)
+
+
+def export_trials(trials_1, trials_2, export_format):
+    """Return the trials of both cars in the given format."""
+    return EXPORT_FORMATS[export_format][1](trials_1, trials_2)
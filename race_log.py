@@ -0,0 +1,200 @@
+"""Append-only binary log of every race tick.
+
+The file starts with a 16-byte header followed by fixed-size records, one per
+tick, in the order they were played by all sessions. Readers memory-map the
+records as a structured array, so a stored race can be replayed and checked
+against the current rules without Streamlit:
+
+    python race_log.py race_log.bin
+"""
+import argparse
+import os
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+from race_engine import EMPIRICAL, THRESHOLD_MODES, RaceEngine
+
+LOG_MAGIC = b"CMRL"
+LOG_VERSION = 2  # Version 2 added the threshold mode; version 1 logs only hold empirical races
+LOG_HEADER = struct.Struct("<4sBxxxII")  # Magic, version, trial size, record size
+
+
+def record_dtype(trial_size=1000, version=LOG_VERSION):
+    """Return the structured dtype of one tick. Index 0 of each pair is the first trial, which drives the green car."""
+    mode = [("threshold_mode", "u1")] if version >= 2 else []  # Index in race_engine.THRESHOLD_MODES
+    return np.dtype([
+        ("race_id", "<u8"),
+        ("tick", "<u4"),
+        ("player_choice", "u1"),
+        ("move_multiplier", "<u2"),
+        *mode,
+        ("due", "<f8"),  # Unix time the tick was scheduled for
+        ("started", "<f8"),  # Unix time the tick actually started
+        ("bits", "u1", (2, (trial_size + 7) // 8)),  # Packed bits of both trials
+        ("ones", "<u2", (2,)),
+        ("entropy", "<f8", (2,)),
+        ("threshold", "<f8", (2,)),
+        ("distance", "<f8", (2,)),  # NaN when the car did not move
+        ("car_pos", "<f8"),  # Red car after the tick
+        ("car2_pos", "<f8"),  # Green car after the tick
+    ])
+
+
+def read_header(path):
+    """Return the (magic, version, trial size, record size) of a race log."""
+    with open(path, "rb") as file:
+        return LOG_HEADER.unpack(file.read(LOG_HEADER.size))
+
+
+class RaceLogWriter:
+    """Appends tick records to the race log, shared by every session of the process.
+
+    A log written with another version or trial size is renamed aside, as
+    race_log.v1-<time>.bin, and a new log is started in its place.
+    """
+
+    def __init__(self, path, trial_size=1000):
+        self.path = path
+        self.trial_size = trial_size
+        self.dtype = record_dtype(trial_size)
+        self._lock = threading.Lock()
+        if os.path.exists(path) and os.path.getsize(path) >= LOG_HEADER.size:
+            header = read_header(path)
+            if header != (LOG_MAGIC, LOG_VERSION, trial_size, self.dtype.itemsize):
+                root, extension = os.path.splitext(path)
+                os.replace(path, f"{root}.v{header[1]}-{time.strftime('%Y%m%dT%H%M%S')}{extension}")
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        with self._lock:
+            if os.fstat(self._fd).st_size == 0:
+                os.write(self._fd, LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, trial_size, self.dtype.itemsize))
+
+    def append(self, race_id, tick, player_choice, move_multiplier, threshold_mode, due, started, packed_bits, ones,
+               entropy, threshold, distance, car_pos, car2_pos):
+        """Append one tick. distance holds None for a car that did not move."""
+        record = np.zeros((), dtype=self.dtype)
+        record["race_id"] = race_id
+        record["tick"] = tick
+        record["player_choice"] = player_choice
+        record["move_multiplier"] = move_multiplier
+        record["threshold_mode"] = THRESHOLD_MODES.index(threshold_mode)
+        record["due"] = due
+        record["started"] = started
+        record["bits"] = packed_bits
+        record["ones"] = ones
+        record["entropy"] = entropy
+        record["threshold"] = threshold
+        record["distance"] = [np.nan if value is None else value for value in distance]
+        record["car_pos"] = car_pos
+        record["car2_pos"] = car2_pos
+        with self._lock:
+            os.write(self._fd, record.tobytes())
+
+    def close(self):
+        os.close(self._fd)
+
+
+class RaceLog:
+    """Memory-mapped view of a race log."""
+
+    def __init__(self, path):
+        magic, version, trial_size, record_size = read_header(path)
+        if magic != LOG_MAGIC or not 1 <= version <= LOG_VERSION:
+            raise ValueError(f"{path} is not a race log")
+        self.version = version
+        self.trial_size = trial_size
+        self.dtype = record_dtype(trial_size, version)
+        if self.dtype.itemsize != record_size:
+            raise ValueError(f"{path} has records of {record_size} bytes, expected {self.dtype.itemsize}")
+        count = (os.path.getsize(path) - LOG_HEADER.size) // record_size  # Ignore a record cut short by a crash
+        if count:
+            self.records = np.memmap(path, dtype=self.dtype, mode="r", offset=LOG_HEADER.size, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def race_ids(self):
+        """Return the ids of the logged races in order of their first tick."""
+        ids, first = np.unique(self.records["race_id"], return_index=True)
+        return [int(race_id) for race_id in ids[np.argsort(first)]]
+
+    def race(self, race_id):
+        """Return the records of one race, in tick order."""
+        records = self.records[self.records["race_id"] == race_id]
+        return records[np.argsort(records["tick"], kind="stable")]
+
+    def races(self, race_ids=None):
+        """Yield (race_id, records) for the given races, or for every race, sorted by id."""
+        records = self.records
+        if race_ids is not None:
+            records = records[np.isin(records["race_id"], race_ids)]
+        records = records[np.lexsort((records["tick"], records["race_id"]))]
+        ids, starts = np.unique(records["race_id"], return_index=True)
+        for race_id, race in zip(ids, np.split(records, starts[1:])):
+            yield int(race_id), race
+
+    def packed_trials(self, race_id):
+        """Return the packed trials of a race, shaped (cars, ticks, bytes), for ReplayBits."""
+        return np.ascontiguousarray(self.race(race_id)["bits"].swapaxes(0, 1))
+
+
+def logged_threshold_mode(records):
+    """Return the threshold mode of a logged race, empirical for logs older than version 2."""
+    if len(records) == 0 or "threshold_mode" not in records.dtype.names:
+        return EMPIRICAL
+    return THRESHOLD_MODES[int(records["threshold_mode"][0])]
+
+
+def check_race(records, trial_size=1000):
+    """Replay logged ticks with the current rules and return the ticks whose outcome differs.
+
+    Each mismatch is a (tick, field) pair. Counts of ones, entropies, thresholds,
+    distances and positions are compared exactly, with the logged threshold mode.
+    """
+    if len(records) == 0:
+        return []
+    engine = RaceEngine(None, None, trial_size, logged_threshold_mode(records))
+    mismatches = []
+    for record in records:
+        # The player may change the multiplier during a race, so it is read at every tick
+        engine.player_choice = int(record["player_choice"])
+        engine.move_multiplier = int(record["move_multiplier"])
+        ones = [engine.evaluator.evaluate_packed(record["bits"][car])[0] for car in range(2)]
+        red_distance, green_distance = engine.step_counts(ones[0], ones[1])
+        expected = {
+            "ones": ones,
+            "entropy": [engine.evaluator.entropy_table[count] for count in ones],
+            "threshold": [threshold.percentile() for threshold in engine.thresholds],
+            "distance": [np.nan if value is None else value for value in (green_distance, red_distance)],
+            "car_pos": engine.car_pos,
+            "car2_pos": engine.car2_pos,
+        }
+        for field, value in expected.items():
+            if not np.array_equal(record[field], value, equal_nan=True):
+                mismatches.append((int(record["tick"]), field))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay logged races and check them against the current rules.")
+    parser.add_argument("path", help="Race log file")
+    args = parser.parse_args()
+
+    log = RaceLog(args.path)
+    failed = 0
+    for race_id, records in log.races():
+        threshold_mode = logged_threshold_mode(records)
+        mismatches = check_race(records, log.trial_size)
+        status = "ok" if not mismatches else f"{len(mismatches)} mismatches, first at tick {mismatches[0][0]} ({mismatches[0][1]})"
+        print(f"{race_id:016x}  {len(records):6d} ticks  {threshold_mode:9}  {status}")
+        failed += bool(mismatches)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
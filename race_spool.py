@@ -0,0 +1,147 @@
+import json
+import sqlite3
+from contextlib import closing, contextmanager
+import threading
+import time
+
+
+def _to_json_value(value):
+    """Convert numpy scalars to plain Python values for JSON."""
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Cannot store {type(value).__name__} in the race spool")
+
+
+class RaceSpool:
+    """Durable write-behind queue of race rows for Google Sheets.
+
+    Rows are committed to a local SQLite file before the race screen moves on.
+    A background thread sends them in batches with append_rows and deletes them
+    only once the write succeeded, so pending rows survive a restart. A failed
+    append may still have been written, so with a key_column the rows whose key
+    is already in the sheet are dropped before the batch is sent again.
+    """
+
+    def __init__(
+        self,
+        path,
+        sheet,
+        batch_size=50,
+        max_retries=5,
+        backoff=2.0,
+        max_backoff=300.0,
+        min_request_interval=1.0,
+        key_column=None,
+    ):
+        self.path = path
+        self.sheet = sheet  # Object with append_rows(rows), and column_values(index) when key_column is set
+        self.key_column = key_column  # Position of a value identifying each row, None to resend failed batches as they are
+        self.batch_size = batch_size
+        self.max_retries = max_retries  # Attempts per batch before pausing
+        self.backoff = backoff  # First retry delay, doubled after each failure
+        self.max_backoff = max_backoff  # Pause after a batch exhausted its retries
+        self.min_request_interval = min_request_interval  # Keeps writes under the Sheets quota
+        self.sent_rows = 0
+        self.failed_requests = 0
+        self.last_error = None
+        self._unconfirmed = False  # The last append failed and may have been written anyway
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS race_rows ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, row TEXT NOT NULL, queued_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection that commits on success and is always closed."""
+        with closing(sqlite3.connect(self.path, timeout=30)) as connection, connection:
+            yield connection
+
+    def start(self):
+        """Start the background flusher."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="race-spool", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the background flusher; queued rows stay in the spool."""
+        self._stopped.set()
+        self._wakeup.set()
+
+    def put(self, row):
+        """Queue a row and return as soon as it is stored on disk."""
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO race_rows (row, queued_at) VALUES (?, ?)",
+                (json.dumps(list(row), default=_to_json_value), time.time()),
+            )
+        self._wakeup.set()
+
+    def pending(self):
+        """Return the number of rows not yet written to Sheets."""
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM race_rows").fetchone()[0]
+
+    def _next_batch(self):
+        with self._connect() as connection:
+            records = connection.execute(
+                "SELECT id, row FROM race_rows ORDER BY id LIMIT ?", (self.batch_size,)
+            ).fetchall()
+        return [record[0] for record in records], [json.loads(record[1]) for record in records]
+
+    def _delete(self, ids):
+        with self._connect() as connection:
+            connection.executemany("DELETE FROM race_rows WHERE id = ?", [(row_id,) for row_id in ids])
+
+    def _unwritten(self, rows):
+        """Return the rows whose key is not in the sheet yet."""
+        if self.key_column is None:
+            return rows
+        written = set(self.sheet.column_values(self.key_column))
+        return [row for row in rows if len(row) <= self.key_column or row[self.key_column] not in written]
+
+    def _send(self, rows):
+        """Send one batch with bounded retries and exponential backoff."""
+        delay = self.backoff
+        for attempt in range(self.max_retries):
+            try:
+                if self._unconfirmed:
+                    rows = self._unwritten(rows)
+                self._unconfirmed = True  # Until append_rows returns, the rows may or may not be in the sheet
+                if rows:
+                    self.sheet.append_rows(rows)
+                self._unconfirmed = False
+                return True
+            except Exception as e:
+                self.failed_requests += 1
+                self.last_error = e
+                if attempt + 1 < self.max_retries and self._stopped.wait(delay):
+                    return False
+                delay = min(delay * 2, self.max_backoff)
+        return False
+
+    def flush(self):
+        """Send queued rows until the spool is empty or a batch fails."""
+        while not self._stopped.is_set():
+            ids, rows = self._next_batch()
+            if not rows:
+                return True
+            if not self._send(rows):
+                return False
+            self._delete(ids)
+            self.sent_rows += len(rows)
+            self._stopped.wait(self.min_request_interval)
+        return False
+
+    def _run(self):
+        while not self._stopped.is_set():
+            if self.flush():
+                self._wakeup.wait()
+                self._wakeup.clear()
+            else:
+                self._stopped.wait(self.max_backoff)
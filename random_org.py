@@ -0,0 +1,264 @@
+"""Resilient access to random.org, shared by every session of the process.
+
+RandomOrgService wraps the rdoclient client. It retries failed requests a few
+times, sizes requests to the allowance left on the API key and opens a circuit
+breaker after repeated failures, so callers fail at once instead of waiting on
+an unreachable server. While the breaker is open the entropy pool probes
+random.org again in the background and the ticks play local bits.
+
+JsonRpcClient speaks the same JSON-RPC methods to any endpoint, such as the
+local stand-in of random_org_stub.py.
+"""
+import json
+import threading
+import time
+import urllib.request
+import uuid
+from datetime import datetime, timedelta, timezone
+
+QUOTA_ERRORS = ("RandomOrgInsufficientBitsError", "RandomOrgInsufficientRequestsError")  # Until the daily reset
+KEY_ERRORS = ("RandomOrgKeyNonExistentError", "RandomOrgKeyNotRunningError", "RandomOrgKeyInvalidAccessError")
+QUOTA_CODES = (402, 403)  # random.org error codes of QUOTA_ERRORS
+KEY_CODES = (400, 401, 404)  # random.org error codes of KEY_ERRORS
+DEFAULT_ADVISORY_DELAY = 1.0  # Wait before the next request when a response gives no advisory delay, as rdoclient
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+def seconds_to_quota_reset(now=None):
+    """Return the seconds until midnight UTC, when random.org resets the daily allowance."""
+    now = now or datetime.now(timezone.utc)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
+
+def error_kind(error):
+    """Return "quota", "key" or None for an exception raised by a random.org client."""
+    code = getattr(error, "code", None)
+    if code in QUOTA_CODES or type(error).__name__ in QUOTA_ERRORS:
+        return "quota"
+    if code in KEY_CODES or type(error).__name__ in KEY_ERRORS:
+        return "key"
+    return None
+
+
+class RandomOrgError(RuntimeError):
+    """Error returned by a random.org JSON-RPC server."""
+
+    def __init__(self, code, message):
+        super().__init__(f"Error {code}: {message}")
+        self.code = code
+
+
+class JsonRpcClient:
+    """random.org client for a configurable JSON-RPC endpoint.
+
+    Offers the methods of rdoclient.RandomOrgClient the app uses, keeps the
+    allowance sent with each response and waits for the advisory delay of the
+    last response before sending the next request.
+    """
+
+    def __init__(self, api_key, url, http_timeout=10.0, clock=time.monotonic, sleep=time.sleep):
+        self.api_key = api_key
+        self.url = url
+        self.http_timeout = http_timeout
+        self.clock = clock
+        self.sleep = sleep
+        self._bits_left = None
+        self._requests_left = None
+        self._next_request_at = 0.0
+
+    def _call(self, method, **params):
+        wait = self._next_request_at - self.clock()
+        if wait > 0:
+            self.sleep(wait)
+        body = {"jsonrpc": "2.0", "method": method, "params": {"apiKey": self.api_key, **params}, "id": uuid.uuid4().hex}
+        request = urllib.request.Request(
+            self.url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.http_timeout) as response:
+            data = json.load(response)
+        if "error" in data:
+            raise RandomOrgError(int(data["error"]["code"]), data["error"]["message"])
+        result = data["result"]
+        if "requestsLeft" in result:
+            self._requests_left = int(result["requestsLeft"])
+            self._bits_left = int(result["bitsLeft"])
+        self._next_request_at = self.clock() + result.get("advisoryDelay", DEFAULT_ADVISORY_DELAY * 1000) / 1000
+        return result
+
+    def generate_integers(self, n, min, max, replacement=True):
+        return self._call("generateIntegers", n=n, min=min, max=max, replacement=replacement)["random"]["data"]
+
+    def generate_blobs(self, n, size, format="base64"):
+        return self._call("generateBlobs", n=n, size=size, format=format)["random"]["data"]
+
+    def generate_signed_blobs(self, n, size, format="base64"):
+        result = self._call("generateSignedBlobs", n=n, size=size, format=format)
+        return {"data": result["random"]["data"], "random": result["random"], "signature": result["signature"]}
+
+    def get_bits_left(self):
+        if self._bits_left is None:
+            self._call("getUsage")
+        return self._bits_left
+
+    def get_requests_left(self):
+        if self._requests_left is None:
+            self._call("getUsage")
+        return self._requests_left
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of sending a request while the circuit breaker is open."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"random.org requests paused for {retry_after:.0f} s")
+        self.retry_after = retry_after  # Seconds until a request may be sent again
+
+
+class CircuitBreaker:
+    """Fails fast after repeated failures and lets a single probe through once the pause is over.
+
+    The pause doubles every time the probe fails, up to max_pause, and goes
+    back to its first value after a success.
+    """
+
+    def __init__(self, failure_threshold=3, pause=5.0, max_pause=300.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold  # Consecutive failures that open the breaker
+        self.pause = pause
+        self.max_pause = max_pause
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0  # Number of times the breaker opened
+        self._next_pause = pause
+        self._reopen_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Raise CircuitOpenError unless a request may be sent now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            remaining = self._reopen_at - self.clock()
+            if self.state == OPEN and remaining <= 0:
+                self.state = HALF_OPEN  # This request is the probe
+                return
+            raise CircuitOpenError(max(remaining, 0.0) if self.state == OPEN else self.pause)
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._next_pause = self.pause
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self._next_pause = min(self._next_pause * 2, self.max_pause)
+                self._open(self._next_pause)
+            elif self.failures >= self.failure_threshold:
+                self._open(self._next_pause)
+
+    def trip(self, pause):
+        """Open the breaker for a given time, as when the allowance is used up."""
+        with self._lock:
+            self._open(pause)
+
+    def retry_after(self):
+        """Return the seconds until the next probe, 0 when requests are allowed."""
+        with self._lock:
+            return max(self._reopen_at - self.clock(), 0.0) if self.state == OPEN else 0.0
+
+    def _open(self, pause):
+        self.state = OPEN
+        self._reopen_at = self.clock() + pause
+        self.opened += 1
+
+
+class RandomOrgService:
+    """random.org client with retries, allowance tracking and a circuit breaker.
+
+    generate_signed_blobs takes the arguments of the rdoclient method, so the
+    service can replace the client in RandomOrgBits.
+    """
+
+    def __init__(self, client, retry_limit=3, retry_delay=0.5, breaker=None, sleep=time.sleep):
+        self.client = client
+        self.retry_limit = retry_limit  # Attempts per call
+        self.retry_delay = retry_delay  # Wait after the first failed attempt, doubled after each one
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+        self.bits_left = None  # Allowance reported with the last response, None until then
+        self.requests_left = None
+        self.requests = 0
+        self.failed_requests = 0
+        self.last_error = None
+        self._lock = threading.Lock()  # One request at a time, as random.org asks of its clients
+
+    def batch_bits(self, num_bits, unit=1):
+        """Return how many of num_bits to request without going over the allowance, in multiples of unit.
+
+        Opens the breaker until the daily reset when not even one unit is left.
+        """
+        if self.bits_left is None:
+            return num_bits
+        fits = min(num_bits, self.bits_left) // unit * unit
+        if fits == 0 or self.requests_left == 0:
+            self.last_error = RuntimeError(f"{self.bits_left} bits and {self.requests_left} requests left on the API key")
+            self.breaker.trip(seconds_to_quota_reset())
+            raise CircuitOpenError(self.breaker.retry_after())
+        return fits
+
+    def generate_signed_blobs(self, n, size, **kwargs):
+        """Request signed blobs, retrying failed attempts until the breaker opens."""
+        with self._lock:
+            delay = self.retry_delay
+            for attempt in range(self.retry_limit):
+                self.breaker.before_request()
+                try:
+                    response = self.client.generate_signed_blobs(n, size, **kwargs)
+                except Exception as e:
+                    self.failed_requests += 1
+                    self.last_error = e
+                    kind = error_kind(e)
+                    if kind == "quota":
+                        self.breaker.trip(seconds_to_quota_reset())
+                        raise
+                    if kind == "key":
+                        self.breaker.trip(self.breaker.max_pause)
+                        raise
+                    self.breaker.record_failure()
+                    if attempt + 1 < self.retry_limit and self.breaker.state == CLOSED:
+                        self.sleep(delay)
+                        delay *= 2
+                    continue
+                self.requests += 1
+                self.breaker.record_success()
+                self._update_usage()
+                return response
+            if self.breaker.state == OPEN:
+                raise CircuitOpenError(self.breaker.retry_after()) from self.last_error
+            raise self.last_error
+
+    def _update_usage(self):
+        # rdoclient keeps the allowance sent with every response, so this makes no request
+        try:
+            self.bits_left = self.client.get_bits_left()
+            self.requests_left = self.client.get_requests_left()
+        except Exception:
+            pass  # Clients without usage data are not limited
+
+    def stats(self):
+        """Return the breaker state, the allowance left and the request counters."""
+        return {
+            "state": self.breaker.state,
+            "retry_after": self.breaker.retry_after(),
+            "bits_left": self.bits_left,
+            "requests_left": self.requests_left,
+            "requests": self.requests,
+            "failed_requests": self.failed_requests,
+            "last_error": str(self.last_error) if self.last_error else None,
+        }
@@ -0,0 +1,199 @@
+"""Local stand-in for the random.org JSON-RPC API, for tests and benchmarks.
+
+Serves generateIntegers, generateBlobs, generateSignedBlobs and getUsage with
+local random data. Response time, the share of failed requests, the daily
+allowance and the advisory delay are configurable. Point the app at it with
+the RANDOM_ORG_URL environment variable:
+
+    python random_org_stub.py --port 8765 --latency 0.2 --latency-sigma 0.5 --error-rate 0.05
+    RANDOM_ORG_URL=http://127.0.0.1:8765/json-rpc/4/invoke streamlit run mind_battle_car_game_streamlit.py
+
+Counters of the requests served are returned by GET /stats.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+INVOKE_PATH = "/json-rpc/4/invoke"
+STATS_PATH = "/stats"
+GENERATE_METHODS = ("generateIntegers", "generateBlobs", "generateSignedBlobs")
+
+
+class RandomOrgStub:
+    """Allowance, counters and failures of the stand-in, shared by all requests."""
+
+    def __init__(self, latency=0.0, latency_sigma=0.0, error_rate=0.0, bits=250000, requests=1000,
+                 advisory_delay=0.0, seed=None):
+        self.latency = latency  # Median response time (seconds)
+        self.latency_sigma = latency_sigma  # Spread of the log-normal response time, 0 for a fixed one
+        self.error_rate = error_rate  # Share of generate requests answered with a server error
+        self.advisory_delay = advisory_delay  # Delay asked of clients before their next request (seconds)
+        self.bits_left = bits
+        self.requests_left = requests
+        self.serial_number = 0
+        self.counters = {"requests": 0, "errors": 0, "quota_errors": 0, "early_requests": 0, "bits_served": 0}
+        self._rng = random.Random(seed)
+        self._not_before = {}  # API key -> time before which a request ignores the advisory delay
+        self._lock = threading.Lock()
+
+    def response_time(self):
+        """Draw the response time of one request."""
+        with self._lock:
+            if self.latency <= 0:
+                return 0.0
+            return self.latency * math.exp(self._rng.gauss(0, self.latency_sigma)) if self.latency_sigma else self.latency
+
+    def handle(self, request):
+        """Return the JSON-RPC response to a request, after the response time."""
+        time.sleep(self.response_time())
+        method = request.get("method")
+        params = request.get("params") or {}
+        with self._lock:
+            self.counters["requests"] += 1
+            api_key = params.get("apiKey")
+            if time.monotonic() < self._not_before.get(api_key, 0.0):
+                self.counters["early_requests"] += 1
+            if method == "getUsage":
+                return self._result(request, self._usage())
+            if method not in GENERATE_METHODS:
+                return self._error(request, -32601, "Method not found")
+            if self._rng.random() < self.error_rate:
+                self.counters["errors"] += 1
+                return self._error(request, -32603, "Internal error")
+            if self.requests_left <= 0:
+                self.counters["quota_errors"] += 1
+                return self._error(request, 402, "The API key you specified has exceeded its daily request allowance")
+            data, bits_used = self._generate(method, params)
+            if bits_used > self.bits_left:
+                self.counters["quota_errors"] += 1
+                return self._error(request, 403, "The API key you specified does not have sufficient bits left")
+            self.bits_left -= bits_used
+            self.requests_left -= 1
+            self.counters["bits_served"] += bits_used
+            self._not_before[api_key] = time.monotonic() + self.advisory_delay
+            random_object = {"data": data, "completionTime": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%SZ")}
+            result = {
+                "random": random_object,
+                "bitsUsed": bits_used,
+                "bitsLeft": self.bits_left,
+                "requestsLeft": self.requests_left,
+                "advisoryDelay": int(self.advisory_delay * 1000),
+            }
+            if method == "generateSignedBlobs":
+                self.serial_number += 1
+                random_object.update({
+                    "method": method,
+                    "hashedApiKey": base64.b64encode(hashlib.sha512(str(api_key).encode()).digest()).decode(),
+                    "n": params["n"],
+                    "size": params["size"],
+                    "format": params.get("format", "base64"),
+                    "serialNumber": self.serial_number,
+                })
+                # Not a real signature, the stand-in has no private key
+                digest = hashlib.sha512(json.dumps(random_object, sort_keys=True).encode()).digest()
+                result["signature"] = base64.b64encode(digest).decode()
+            return self._result(request, result)
+
+    def _generate(self, method, params):
+        n = int(params["n"])
+        if method == "generateIntegers":
+            low, high = int(params["min"]), int(params["max"])
+            return [self._rng.randint(low, high) for _ in range(n)], n * math.ceil(math.log2(high - low + 1))
+        size = int(params["size"])
+        blobs = [self._rng.randbytes(size // 8) for _ in range(n)]
+        if params.get("format", "base64") == "hex":
+            return [blob.hex() for blob in blobs], n * size
+        return [base64.b64encode(blob).decode() for blob in blobs], n * size
+
+    def _usage(self):
+        return {"status": "running", "bitsLeft": self.bits_left, "requestsLeft": self.requests_left}
+
+    def stats(self):
+        """Return the counters and the allowance left."""
+        with self._lock:
+            return dict(self.counters, **self._usage())
+
+    @staticmethod
+    def _result(request, result):
+        return {"jsonrpc": "2.0", "result": result, "id": request.get("id")}
+
+    @staticmethod
+    def _error(request, code, message):
+        return {"jsonrpc": "2.0", "error": {"code": code, "message": message, "data": None}, "id": request.get("id")}
+
+
+def make_handler(stub):
+    """Return the HTTP request handler serving a stub."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != INVOKE_PATH:
+                self.send_error(404)
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            self._send_json(stub.handle(request))
+
+        def do_GET(self):
+            if self.path != STATS_PATH:
+                self.send_error(404)
+                return
+            self._send_json(stub.stats())
+
+        def _send_json(self, data):
+            body = json.dumps(data).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # One line per request would drown the benchmark output
+
+    return Handler
+
+
+def start_server(stub, host="127.0.0.1", port=0):
+    """Serve a stub from a background thread and return the server and its invoke URL."""
+    server = ThreadingHTTPServer((host, port), make_handler(stub))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="random-org-stub", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}{INVOKE_PATH}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the random.org JSON-RPC API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Median response time (seconds)")
+    parser.add_argument("--latency-sigma", type=float, default=0.0, help="Log-normal spread of the response time")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with a server error")
+    parser.add_argument("--bits", type=int, default=250000, help="Bits allowance")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests allowance")
+    parser.add_argument("--advisory-delay", type=float, default=0.0, help="Advisory delay sent to clients (seconds)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the data, latencies and failures")
+    args = parser.parse_args()
+
+    stub = RandomOrgStub(args.latency, args.latency_sigma, args.error_rate, args.bits, args.requests,
+                         args.advisory_delay, args.seed)
+    server, url = start_server(stub, args.host, args.port)
+    print(f"random.org stand-in at {url}, press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    print(json.dumps(stub.stats()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import threading
+import time
+
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+TOKEN_LIFETIME = 55 * 60  # Re-authorize before the one-hour access token expires
+RECONNECT_STATUS = (401,)  # HTTP status of an expired or revoked access token
+RECONNECT_ERRORS = ("ConnectionError", "AccessTokenRefreshError")  # requests and oauth2client, matched by name
+
+
+def needs_reconnect(error):
+    """Return True if an error means the connection or its credentials are no longer usable.
+
+    Quota errors and read timeouts keep the connection: the request may even
+    have been written, so it is neither reconnected nor repeated here.
+    """
+    if getattr(getattr(error, "response", None), "status_code", None) in RECONNECT_STATUS:
+        return True
+    return any(cls.__name__ in RECONNECT_ERRORS for cls in type(error).__mro__)
+
+
+class SheetsConnection:
+    """Google Sheets worksheet handle shared by every session of the process.
+
+    The connection is opened on first use, re-authorized when the access token
+    is about to expire and dropped after an auth or connection error, so the
+    next request reconnects. Failed requests are never repeated here: appends
+    are not idempotent, and retries are left to the caller, as RaceSpool does.
+    """
+
+    def __init__(self, credentials_info, sheet_name, scope=SCOPE):
+        self.credentials_info = credentials_info
+        self.sheet_name = sheet_name
+        self.scope = scope
+        self._lock = threading.Lock()
+        self._worksheet = None
+        self._spreadsheet_id = None  # Avoids a Drive lookup by name on reconnect
+        self._connected_at = 0.0
+
+    def _connect(self):
+        # Imported on the first connection, so visitors who never finish a race do not load them
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
+
+        credentials = ServiceAccountCredentials.from_json_keyfile_dict(self.credentials_info, self.scope)
+        client = gspread.authorize(credentials)
+        if self._spreadsheet_id:
+            spreadsheet = client.open_by_key(self._spreadsheet_id)
+        else:
+            spreadsheet = client.open(self.sheet_name)
+            self._spreadsheet_id = spreadsheet.id
+        self._worksheet = spreadsheet.sheet1  # First sheet
+        self._connected_at = time.monotonic()
+
+    def worksheet(self):
+        """Return the first worksheet, connecting or re-authorizing if needed."""
+        with self._lock:
+            if self._worksheet is None or time.monotonic() - self._connected_at > TOKEN_LIFETIME:
+                self._connect()
+            return self._worksheet
+
+    def reset(self):
+        """Drop the current connection so the next request reconnects."""
+        with self._lock:
+            self._worksheet = None
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            return getattr(self.worksheet(), method)(*args, **kwargs)
+        except Exception as e:
+            if needs_reconnect(e):
+                self.reset()
+            raise
+
+    def append_row(self, row):
+        """Append one row."""
+        return self._call("append_row", row)
+
+    def append_rows(self, rows):
+        """Append several rows in one request."""
+        return self._call("append_rows", rows)
+
+    def column_values(self, index):
+        """Return the values of a column, counted from 0."""
+        return self._call("col_values", index + 1)
@@ -0,0 +1,59 @@
+"""The streaming threshold must match np.percentile on recorded races.
+
+tests/data/race_packed.bin is a race played in the app and saved with
+race_export.export_packed. Its bits are also cut into trials of other sizes,
+odd ones and small ones where many trials share an entropy.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from entropy_stats import EntropyPercentile, entropy_by_count
+from race_export import read_packed
+
+RACE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "race_packed.bin")
+TRIAL_SIZES = [1000, 999, 125, 64, 33, 8, 7, 3, 2, 1]
+MAX_TRIALS = 2000  # Trials checked per car and size, each against a full np.percentile
+
+
+def recorded_counts(trial_size):
+    """Return the number of ones of each trial of both cars, with the recorded bits cut into trials of trial_size."""
+    recorded_size, packed = read_packed(open(RACE_PATH, "rb").read())
+    cars = []
+    for rows in packed:
+        bits = np.unpackbits(rows, axis=1, count=recorded_size).ravel()
+        trials = min(len(bits) // trial_size, MAX_TRIALS)
+        cars.append(bits[:trials * trial_size].reshape(trials, trial_size).sum(axis=1))
+    return cars
+
+
+@pytest.mark.parametrize("trial_size", TRIAL_SIZES)
+def test_percentile_matches_np_percentile_after_every_trial(trial_size):
+    table = entropy_by_count(trial_size)
+    for counts in recorded_counts(trial_size):
+        threshold = EntropyPercentile(trial_size, 5)
+        history = np.empty(len(counts))
+        for index, count in enumerate(counts):
+            history[index] = threshold.add(int(count))
+            assert history[index] == table[count]
+            assert threshold.percentile() == np.percentile(history[:index + 1], 5), f"trial {index}"
+
+
+@pytest.mark.parametrize("trial_size", [1000, 7])
+def test_add_many_matches_add(trial_size):
+    for counts in recorded_counts(trial_size):
+        one_by_one = EntropyPercentile(trial_size, 5)
+        expected = []
+        for count in counts:
+            one_by_one.add(int(count))
+            expected.append(one_by_one.percentile())
+        assert EntropyPercentile(trial_size, 5).add_many(counts).tolist() == expected
+
+
+@pytest.mark.parametrize("trial_size", [8, 7, 3])
+def test_recorded_trials_have_ties(trial_size):
+    """Small trial sizes are only useful here if many trials share an entropy."""
+    table = np.array(entropy_by_count(trial_size))
+    for counts in recorded_counts(trial_size):
+        assert len(np.unique(table[counts])) < len(counts) // 10
@@ -0,0 +1,82 @@
+"""Batches of trials must move the cars exactly as the per-trial game logic.
+
+The reference evaluates each trial of tests/data/race_packed.bin on its own:
+Shannon entropy of the unpacked bits, np.percentile over every entropy of the
+race so far and decide_moves.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from entropy_stats import TrialEvaluator, majority_bit, shannon_entropy
+from race_engine import EMPIRICAL, THRESHOLD_PERCENTILE, TrialBatch, decide_moves, threshold_tracker
+from race_export import read_packed
+
+RACE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "race_packed.bin")
+BATCH_SIZE = 10  # Trials per batch, as in the app
+
+
+def recorded_race():
+    """Return the trial size and the packed trials of both cars, shaped (cars, trials, bytes)."""
+    return read_packed(open(RACE_PATH, "rb").read())
+
+
+def per_trial_moves(packed, trial_size, player_choice, move_multiplier):
+    """Return the distances moved at every trial, trial by trial with np.percentile."""
+    history = ([], [])
+    moves = []
+    for rows in zip(packed[0], packed[1]):
+        bits = [np.unpackbits(row, count=trial_size) for row in rows]
+        entropies = [shannon_entropy(car_bits) for car_bits in bits]
+        thresholds = []
+        for entropy, car_history in zip(entropies, history):
+            car_history.append(entropy)
+            thresholds.append(np.percentile(car_history, THRESHOLD_PERCENTILE))
+        majority_1 = majority_bit(int(bits[0].sum()), trial_size)
+        moves.append(decide_moves(
+            player_choice, move_multiplier, majority_1, entropies[0], thresholds[0], entropies[1], thresholds[1]
+        ))
+    return moves
+
+
+def batch_moves(packed, trial_size, player_choice, move_multiplier):
+    """Return the distances moved at every trial, played from batches as the app does."""
+    evaluator = TrialEvaluator(trial_size)
+    thresholds = (threshold_tracker(EMPIRICAL, trial_size), threshold_tracker(EMPIRICAL, trial_size))
+    sources = [None] * packed.shape[1]
+    moves = []
+    for start in range(0, packed.shape[1], BATCH_SIZE):
+        batch = TrialBatch(
+            packed[:, start:start + BATCH_SIZE],
+            (sources[start:start + BATCH_SIZE], sources[start:start + BATCH_SIZE]),
+            evaluator,
+            thresholds,
+        )
+        while batch.remaining():
+            trial = batch.next_trial(player_choice, move_multiplier)
+            moves.append((trial["red_distance"], trial["green_distance"]))
+    return moves
+
+
+@pytest.mark.parametrize("player_choice", [0, 1])
+@pytest.mark.parametrize("move_multiplier", [1, 37])
+def test_batches_match_per_trial_logic(player_choice, move_multiplier):
+    trial_size, packed = recorded_race()
+    expected = per_trial_moves(packed, trial_size, player_choice, move_multiplier)
+    assert batch_moves(packed, trial_size, player_choice, move_multiplier) == expected
+    assert any(move != (None, None) for move in expected)
+
+
+def test_unplayed_trials_start_a_new_race():
+    """Trials left by a race are evaluated again against the thresholds of the next race."""
+    trial_size, packed = recorded_race()
+    evaluator = TrialEvaluator(trial_size)
+    thresholds = (threshold_tracker(EMPIRICAL, trial_size), threshold_tracker(EMPIRICAL, trial_size))
+    sources = list(range(packed.shape[1]))
+    batch = TrialBatch(packed, (sources, sources), evaluator, thresholds)
+    for _ in range(packed.shape[1] - BATCH_SIZE):
+        batch.next_trial(1, 1)
+    rows, unplayed_sources = batch.unplayed()
+    assert unplayed_sources == (sources[-BATCH_SIZE:], sources[-BATCH_SIZE:])
+    assert batch_moves(rows, trial_size, 1, 1) == per_trial_moves(packed[:, -BATCH_SIZE:], trial_size, 1, 1)
@@ -0,0 +1,66 @@
+"""A race written to the race log must read back and pass check_race.
+
+The race plays the first ticks of tests/data/race_packed.bin from batches,
+as the app does, and logs every tick with RaceLogWriter.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from entropy_stats import TrialEvaluator
+from race_engine import START_POSITION, THRESHOLD_MODES, TrialBatch, move_car, threshold_tracker
+from race_export import read_packed
+from race_log import RaceLog, RaceLogWriter, check_race, logged_threshold_mode
+
+RACE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "race_packed.bin")
+RACE_ID = 0x1234ABCD
+TICKS = 40
+PLAYER_CHOICE = 1
+MOVE_MULTIPLIER = 20
+
+
+def write_race(path, threshold_mode):
+    """Play and log the first TICKS ticks of the recorded race, then return the trial size."""
+    trial_size, packed = read_packed(open(RACE_PATH, "rb").read())
+    packed = packed[:, :TICKS]
+    thresholds = (threshold_tracker(threshold_mode, trial_size), threshold_tracker(threshold_mode, trial_size))
+    batch = TrialBatch(packed, ([None] * TICKS, [None] * TICKS), TrialEvaluator(trial_size), thresholds)
+    writer = RaceLogWriter(path, trial_size)
+    car_pos = car2_pos = START_POSITION
+    for tick in range(TICKS):
+        trial = batch.next_trial(PLAYER_CHOICE, MOVE_MULTIPLIER)
+        red_distance, green_distance = trial["red_distance"], trial["green_distance"]
+        if green_distance is not None:
+            car2_pos = move_car(car2_pos, green_distance)
+        if red_distance is not None:
+            car_pos = move_car(car_pos, red_distance)
+        writer.append(
+            RACE_ID, tick, PLAYER_CHOICE, MOVE_MULTIPLIER, threshold_mode, 0.5 * tick, 0.5 * tick,
+            trial["packed"], trial["counts"], trial["entropies"], trial["thresholds"],
+            (green_distance, red_distance), car_pos, car2_pos,
+        )
+    writer.close()
+    return trial_size
+
+
+@pytest.mark.parametrize("threshold_mode", THRESHOLD_MODES)
+def test_logged_race_reads_back_and_checks(tmp_path, threshold_mode):
+    path = str(tmp_path / "race_log.bin")
+    trial_size = write_race(path, threshold_mode)
+    log = RaceLog(path)
+    assert len(log) == TICKS
+    assert log.race_ids() == [RACE_ID]
+    records = log.race(RACE_ID)
+    assert logged_threshold_mode(records) == threshold_mode
+    assert np.isfinite(records["distance"]).any()
+    assert check_race(records, trial_size) == []
+
+
+def test_tampered_distance_is_reported(tmp_path):
+    path = str(tmp_path / "race_log.bin")
+    trial_size = write_race(path, THRESHOLD_MODES[0])
+    records = np.array(RaceLog(path).race(RACE_ID))
+    tick = int(np.flatnonzero(np.isfinite(records["distance"]).any(axis=1))[0])
+    records["distance"][tick] += 1.0
+    assert (tick, "distance") in check_race(records, trial_size)
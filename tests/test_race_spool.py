@@ -0,0 +1,32 @@
+"""A failed append that reached the sheet must not be written twice."""
+from race_spool import RaceSpool
+
+
+class FlakySheet:
+    """Worksheet stand-in whose first appends time out after the rows were written."""
+
+    def __init__(self, timeouts):
+        self.rows = []
+        self.timeouts = timeouts
+
+    def append_rows(self, rows):
+        self.rows.extend(rows)
+        if self.timeouts:
+            self.timeouts -= 1
+            raise TimeoutError("read timed out")
+
+    def column_values(self, index):
+        return [row[index] for row in self.rows]
+
+
+def test_rows_written_before_a_failure_are_not_sent_again(tmp_path):
+    sheet = FlakySheet(timeouts=2)
+    spool = RaceSpool(str(tmp_path / "spool.sqlite3"), sheet, backoff=0, min_request_interval=0, key_column=1)
+    spool.put(["race", "a"])
+    spool.put(["race", "b"])
+    assert spool.flush()
+    spool.put(["race", "c"])
+    assert spool.flush()
+    assert [row[1] for row in sheet.rows] == ["a", "b", "c"]
+    assert spool.pending() == 0
+    assert spool.failed_requests == 2
@@ -0,0 +1,137 @@
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+# Bucket upper bounds in seconds, from 10 µs to 10 s
+BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+# fetch_1, fetch_2, fetch and evaluate_batch are only observed on the ticks that build a batch of trials
+STAGES = (
+    "fetch_1", "fetch_2", "fetch", "evaluate_batch", "store", "move", "log", "display", "sleep", "lateness", "tick",
+)
+COUNTERS = ("ticks", "local_fallbacks", "interval_overruns", "skipped_ticks")
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot counts values above every bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Approximate a quantile by the upper bound of the bucket holding it."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class TickMetrics:
+    """Timings of every stage of the race loop, aggregated over all sessions."""
+
+    def __init__(self, prefix="car_mind_race"):
+        self.prefix = prefix
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._lock = threading.Lock()
+        self._written_at = 0.0
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.histograms[stage].observe(seconds)
+
+    def increment(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] += amount
+
+    def timer(self):
+        """Return a TickTimer that records consecutive stages of one tick."""
+        return TickTimer(self)
+
+    def summary(self):
+        """Return count, mean, p50 and p95 in milliseconds for each stage."""
+        with self._lock:
+            rows = []
+            for stage, histogram in self.histograms.items():
+                if histogram.count == 0:
+                    continue
+                rows.append({
+                    "stage": stage,
+                    "count": histogram.count,
+                    "mean_ms": 1000 * histogram.sum / histogram.count,
+                    "p50_ms": 1000 * histogram.quantile(0.5),
+                    "p95_ms": 1000 * histogram.quantile(0.95),
+                })
+            return rows, dict(self.counters)
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            name = f"{self.prefix}_stage_seconds"
+            lines.append(f"# HELP {name} Duration of each stage of a race tick.")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, histogram in self.histograms.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+            for counter, value in self.counters.items():
+                name = f"{self.prefix}_{counter}_total"
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Atomically write the metrics to a file read by a local collector."""
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp") as file:
+            file.write(self.render())
+        os.chmod(file.name, 0o644)  # NamedTemporaryFile creates 0600, unreadable by a collector running as its own user
+        os.replace(file.name, path)
+
+    def write_every(self, path, interval):
+        """Write the metrics file unless it was written less than interval seconds ago."""
+        now = time.monotonic()
+        if now - self._written_at >= interval:
+            self._written_at = now
+            self.write(path)
+
+
+class TickTimer:
+    """Measures consecutive stages of one tick with a single clock read per stage."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.start = self.last = time.perf_counter()
+
+    def lap(self, stage):
+        """Record and return the time since the previous lap under the given stage."""
+        now = time.perf_counter()
+        seconds = now - self.last
+        self.metrics.observe(stage, seconds)
+        self.last = now
+        return seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
@@ -0,0 +1,93 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SKIP = "skip"  # Drop the ticks missed during a stall and resume on the current slot
+CATCH_UP = "catch_up"  # Run the missed ticks back to back until the schedule is met again
+POLICIES = (SKIP, CATCH_UP)
+
+
+class ScheduledTick:
+    """When a tick was due and when it actually started, as Unix times."""
+
+    __slots__ = ("index", "due", "started", "slept", "skipped")
+
+    def __init__(self, index, due, started, slept, skipped):
+        self.index = index
+        self.due = due
+        self.started = started
+        self.slept = slept  # Seconds spent waiting for this tick
+        self.skipped = skipped  # Slots dropped just before this tick
+
+    @property
+    def lateness(self):
+        return max(self.started - self.due, 0.0)
+
+    def as_row(self):
+        return (self.index, self.due, self.started)
+
+
+class TickScheduler:
+    """Fixed-rate schedule of race ticks that compensates for drift.
+
+    Ticks are due at start + n × interval, so time lost to a slow tick or an
+    imprecise sleep is taken from the next wait instead of piling up. When a
+    tick starts a whole interval late or more, the policy decides whether the
+    missed slots are skipped or caught up. Catching up never runs more than
+    max_catch_up missed ticks in a row.
+    """
+
+    def __init__(self, interval, policy=SKIP, max_catch_up=10, clock=time.monotonic, sleep=time.sleep):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown tick policy: {policy}")
+        self.interval = interval
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.clock = clock
+        self.sleep = sleep
+        self.origin = clock()
+        self.wall_origin = time.time() - (clock() - self.origin)
+        self.next_due = self.origin
+        self.ticks = 0
+        self.skipped = 0
+
+    def wait(self):
+        """Sleep until the next tick is due and return it as a ScheduledTick."""
+        now = self.clock()
+        slept = 0.0
+        if now < self.next_due:
+            self.sleep(self.next_due - now)
+            after = self.clock()
+            slept = after - now
+            now = after
+        due = self.next_due
+        skipped = 0
+        if self.interval > 0:
+            missed = int((now - due) // self.interval)
+            if self.policy == SKIP:
+                skipped = missed
+            else:
+                skipped = max(missed - self.max_catch_up, 0)
+            due += skipped * self.interval
+        self.skipped += skipped
+        self.next_due = due + self.interval
+        tick = ScheduledTick(self.ticks, self._wall(due), self._wall(now), slept, skipped)
+        self.ticks += 1
+        return tick
+
+    def _wall(self, moment):
+        return self.wall_origin + (moment - self.origin)
+
+
+class ConcurrentFetcher:
+    """Run the fetches of all cars at the same time on a small thread pool."""
+
+    def __init__(self, max_workers=8):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="trial-fetch")
+
+    def fetch(self, *fetches):
+        """Call every fetch concurrently and return their results in order."""
+        futures = [self.executor.submit(fetch) for fetch in fetches]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,48 @@
+import os
+
+import streamlit.components.v1 as components
+
+TRACK_COMPONENT_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "track_component")
+
+_race_track = components.declare_component("race_track", path=TRACK_COMPONENT_DIR)
+
+
+def track_cars(car_pos, car2_pos, moved=(False, False), red_number=None, green_number=None):
+    """Describe both lanes of the track for race_track: red car first, green car second."""
+    return [
+        {
+            "position": float(car_pos),
+            "moved": bool(moved[0]),
+            "car": "car.png",
+            "flag": "bandierina.png",
+            "number": red_number,
+        },
+        {
+            "position": float(car2_pos),
+            "moved": bool(moved[1]),
+            "car": "car2.png",
+            "flag": "bandierina.png",
+            "number": green_number,
+        },
+    ]
+
+
+def race_track(cars, asset_version, assets=None, interval=0.5, tick=0):
+    """Render the race track.
+
+    cars holds one dict per lane with the position, the move flag and the file
+    names of the car, flag and number images. The image encodings only need to
+    be passed with the first render of a script run; later renders send the
+    positions alone and the browser animates the cars between them.
+
+    Each tick mounts a new frame, which finds the images and the last positions
+    kept for the tab by the previous frames.
+    """
+    return _race_track(
+        cars=cars,
+        asset_version=asset_version,
+        assets=assets,
+        interval=interval,
+        tick=tick,  # Keeps every render of the same script run distinct, which also remounts the frame
+        default=None,
+    )
@@ -0,0 +1,180 @@
+"""Columnar archive of every trial played, for research queries.
+
+The tick loop hands each tick to TrialArchive.append, which only buffers it. A
+background thread writes the buffer as Parquet files, one row per trial of
+each car, under a Hive-style layout:
+
+    trial_archive/date=2026-10-18/session=<session id>/part-<time>-<n>.parquet
+
+so a query filtering on date, session or any column reads only the files and
+row groups it needs:
+
+    import pyarrow.dataset as ds
+    trials = open_archive("trial_archive").to_table(filter=ds.field("moved"), columns=["entropy", "threshold"])
+
+Needs pyarrow; without it the app runs with the archive disabled.
+"""
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from importlib.util import find_spec
+
+from entropy_stats import majority_bit
+
+HAS_PYARROW = find_spec("pyarrow") is not None
+
+
+def archive_schema(trial_size=1000):
+    """Return the Arrow schema of the archive. Car 0 is the first trial, which drives the green car."""
+    import pyarrow as pa
+
+    return pa.schema([
+        ("race_id", pa.uint64()),
+        ("tick", pa.uint32()),
+        ("car", pa.uint8()),
+        ("started", pa.timestamp("us", tz="UTC")),  # When the tick started
+        ("player_choice", pa.uint8()),
+        ("move_multiplier", pa.uint16()),
+        ("ones", pa.uint16()),
+        ("entropy", pa.float64()),
+        ("threshold", pa.float64()),
+        ("majority_bit", pa.int8()),  # -1 on a tie
+        ("moved", pa.bool_()),
+        ("distance", pa.float64()),  # Null when the car did not move
+        ("source", pa.string()),  # Bit source that produced the trial, "local" for a random.org fallback
+        ("serial_number", pa.int64()),  # random.org response holding the bits, null for other sources
+        ("bit_offset", pa.int32()),  # Position of the first bit in that response
+        ("bits", pa.binary((trial_size + 7) // 8)),  # Packed bits, as in the race log
+    ])
+
+
+def open_archive(root):
+    """Return the archive as a pyarrow dataset, with date and session as partition columns."""
+    import pyarrow.dataset as ds
+
+    return ds.dataset(root, format="parquet", partitioning="hive")
+
+
+class TrialArchive:
+    """Buffers the trials of every session of the process and writes them to Parquet in the background.
+
+    A flush writes one file per date and session present in the buffer. It runs
+    every flush_interval seconds, as soon as flush_rows ticks are buffered, or
+    when asked to, as at the end of a race.
+    """
+
+    def __init__(self, root, trial_size=1000, flush_rows=5000, flush_interval=30.0):
+        self.root = root
+        self.trial_size = trial_size
+        self.flush_rows = flush_rows  # Ticks buffered before a flush is started
+        self.flush_interval = flush_interval  # Longest time a tick stays in memory (in seconds)
+        self.written_rows = 0
+        self.files = 0
+        self.failed_flushes = 0
+        self.last_error = None
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background writer."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="trial-archive", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        """Stop the background writer and write what is still buffered."""
+        self._stopped.set()
+        self._wakeup.set()
+        self.flush()
+
+    def append(self, session_id, race_id, tick, started, player_choice, move_multiplier, packed_bits, ones,
+               entropy, threshold, distance, sources, source_name):
+        """Buffer one tick. Pairs hold the values of both trials; sources the random.org provenance or None."""
+        with self._lock:
+            self._buffer.append((session_id, race_id, tick, started, player_choice, move_multiplier, packed_bits,
+                                 ones, entropy, threshold, distance, sources, source_name))
+            full = len(self._buffer) >= self.flush_rows
+        if full:
+            self._wakeup.set()
+
+    def request_flush(self):
+        """Ask the background writer to flush now."""
+        self._wakeup.set()
+
+    def pending(self):
+        """Return the number of ticks not written yet."""
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self):
+        """Write the buffered ticks, one file per date and session, and return the number of trials written."""
+        with self._flush_lock:
+            with self._lock:
+                ticks, self._buffer = self._buffer, []
+            if not ticks:
+                return 0
+            partitions = {}
+            for tick in ticks:
+                day = datetime.fromtimestamp(tick[3], timezone.utc).strftime("%Y-%m-%d")
+                partitions.setdefault((day, tick[0]), []).append(tick)
+            written = 0
+            for (day, session_id), session_ticks in partitions.items():
+                try:
+                    written += self._write(day, session_id, session_ticks)
+                except Exception as e:
+                    # Keep the ticks for the next flush
+                    self.failed_flushes += 1
+                    self.last_error = e
+                    with self._lock:
+                        self._buffer[:0] = session_ticks
+            return written
+
+    def _write(self, day, session_id, ticks):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        columns = {name: [] for name in archive_schema(self.trial_size).names}
+        for (_, race_id, tick, started, player_choice, move_multiplier, packed_bits, ones, entropy, threshold,
+             distance, sources, source_name) in ticks:
+            for car in range(2):
+                count = int(ones[car])
+                majority = majority_bit(count, self.trial_size)
+                source = sources[car]
+                columns["race_id"].append(race_id)
+                columns["tick"].append(tick)
+                columns["car"].append(car)
+                columns["started"].append(int(started * 1e6))
+                columns["player_choice"].append(player_choice)
+                columns["move_multiplier"].append(move_multiplier)
+                columns["ones"].append(count)
+                columns["entropy"].append(float(entropy[car]))
+                columns["threshold"].append(float(threshold[car]))
+                columns["majority_bit"].append(-1 if majority is None else majority)
+                columns["moved"].append(distance[car] is not None)
+                columns["distance"].append(distance[car])
+                columns["source"].append(source_name if source is not None or source_name != "random.org" else "local")
+                columns["serial_number"].append(source[0] if source is not None else None)
+                columns["bit_offset"].append(source[1] if source is not None else None)
+                columns["bits"].append(bytes(packed_bits[car]))
+        table = pa.table(columns, schema=archive_schema(self.trial_size))
+        directory = os.path.join(self.root, f"date={day}", f"session={session_id}")
+        os.makedirs(directory, exist_ok=True)
+        name = f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet"
+        pq.write_table(table, os.path.join(directory, name))
+        self.files += 1
+        self.written_rows += table.num_rows
+        return table.num_rows
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
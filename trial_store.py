@@ -0,0 +1,64 @@
+import numpy as np
+
+from entropy_stats import pack_bits, popcount
+
+
+class TrialStore:
+    """Packed history of the trials drawn for one car.
+
+    Each trial is stored as a row of packed bytes in a preallocated buffer that
+    doubles when full, and the number of ones is kept as a running counter.
+    """
+
+    def __init__(self, trial_size=1000, capacity=256):
+        self.trial_size = trial_size
+        self.row_bytes = (trial_size + 7) // 8
+        self._packed = np.zeros((capacity, self.row_bytes), dtype=np.uint8)
+        self.count = 0  # Number of stored trials
+        self.ones = 0  # Running number of ones over all trials
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def zeros(self):
+        """Running number of zeros over all trials."""
+        return self.count * self.trial_size - self.ones
+
+    @property
+    def nbytes(self):
+        """Memory held by the packed buffer."""
+        return self._packed.nbytes
+
+    def _grow(self):
+        packed = np.zeros((2 * len(self._packed), self.row_bytes), dtype=np.uint8)
+        packed[:self.count] = self._packed[:self.count]
+        self._packed = packed
+
+    def append_packed(self, packed, count_1=None):
+        """Store a trial given as packed bytes and return its number of ones."""
+        if self.count == len(self._packed):
+            self._grow()
+        self._packed[self.count] = packed
+        if count_1 is None:
+            count_1 = popcount(packed)
+        self.count += 1
+        self.ones += count_1
+        return count_1
+
+    def append(self, bits, count_1=None):
+        """Store a trial given as a sequence of 0/1 bits."""
+        return self.append_packed(pack_bits(bits), count_1)
+
+    def packed(self):
+        """Return a view of the packed trials, one row per trial."""
+        return self._packed[:self.count]
+
+    def bits(self, index):
+        """Return the bits of one trial as a uint8 array."""
+        return np.unpackbits(self._packed[index], count=self.trial_size)
+
+    def bit_strings(self):
+        """Yield each trial as a string of '0' and '1' characters."""
+        for row in self.packed():
+            yield (np.unpackbits(row, count=self.trial_size) + ord("0")).tobytes().decode("ascii")